@@ -98,6 +98,10 @@ activities.  This is where your activity starts.
     called by the toolkit to tell your activity that it must load or
     save the data the user is working on.
 
+    To save while the activity is running, call
+    :func:`~sugar3.activity.activity.Activity.schedule_save()` when the
+    document changes; requests are coalesced into occasional saves.
+
 **Activity toolbars**
 
     Add any activity toolbars before the last separator in the
@@ -158,6 +162,10 @@ Hint: A good and simple activity to learn from is the Read activity.
 You may copy it and use it as a template.
 '''
 
+from sugar3 import tracing
+
+_import_start_time = tracing.now()
+
 import gettext
 import logging
 import os
@@ -180,13 +188,7 @@ from gi.repository import Gdk
 from gi.repository import Gtk
 import dbus
 import dbus.service
-from dbus import PROPERTIES_IFACE
-from telepathy.server import DBusProperties
-from telepathy.interfaces import CHANNEL, \
-    CHANNEL_TYPE_TEXT, \
-    CLIENT, \
-    CLIENT_HANDLER
-from telepathy.constants import CONNECTION_HANDLE_TYPE_CONTACT
+from telepathy.interfaces import CHANNEL
 from telepathy.constants import CONNECTION_HANDLE_TYPE_ROOM
 
 from sugar3 import util
@@ -194,6 +196,7 @@ from sugar3 import power
 from sugar3.profile import get_color, get_save_as
 from sugar3.presence import presenceservice
 from sugar3.activity.activityservice import ActivityService
+from sugar3.activity.activityservice import ClientHandler
 from sugar3.graphics import style
 from sugar3.graphics.window import Window
 from sugar3.graphics.alert import Alert
@@ -227,6 +230,61 @@ PREVIEW_SIZE = style.zoom(300), style.zoom(225)
 Size of a preview image for journal object metadata.
 """
 
+AUTOSAVE_DELAY = 1000
+"""
+Time in milliseconds to wait for further save requests before an
+autosave scheduled with :meth:`Activity.schedule_save` is written.
+"""
+
+AUTOSAVE_MIN_INTERVAL = 10000
+"""
+Minimum time in milliseconds between the start of two autosaves.
+"""
+
+AUTOSAVE_MAX_DELAY = 30000
+"""
+Maximum time in milliseconds between the first pending request and
+the autosave, when new requests keep coming.
+"""
+
+TIMES_HISTORY_SIZE = 50
+"""
+Maximum number of entries kept in the `launch-times` and `spent-times`
+journal object metadata.  Older entries are folded into the
+`launch-times-folded` (a count of launches) and `spent-times-folded`
+(a sum of seconds) metadata.
+"""
+
+
+def _times_to_int(value):
+    try:
+        return int(value)
+    except ValueError:
+        return 0
+
+
+def _push_times_value(metadata, key, value, fold):
+    if metadata.get(key):
+        values = str(metadata[key]).split(', ')
+    else:
+        values = []
+    values.append('%d' % value)
+
+    if len(values) > TIMES_HISTORY_SIZE:
+        dropped = values[:-TIMES_HISTORY_SIZE]
+        values = values[-TIMES_HISTORY_SIZE:]
+
+        folded_key = key + '-folded'
+        folded = _times_to_int(metadata.get(folded_key, '0'))
+        metadata[folded_key] = '%d' % (folded + fold(dropped))
+
+    metadata[key] = ', '.join(values)
+
+
+def _set_last_times_value(values, new_value):
+    head, separator = values.rpartition(', ')[:2]
+    return '%s%s%d' % (head, separator, new_value)
+
 
 class _ActivitySession(GObject.GObject):
 
@@ -315,7 +373,21 @@ class Activity(Window, Gtk.Container):
         '_closing': (GObject.SignalFlags.RUN_FIRST, None, ([])),
     }
 
+    deferred_startup = False
+    '''
+    Whether the journal object, the sharing setup and the activity D-Bus
+    service are set up after the window is first drawn, instead of
+    during :func:`__init__`.  Activities setting this class attribute to
+    True get their first frame on screen sooner, but must not use
+    :attr:`metadata` or :attr:`shared_activity` in :func:`__init__`;
+    :meth:`read_file` and the **shared** and **joined** signals are
+    called as usual once the setup is done.
+    '''
+
     def __init__(self, handle, create_jobject=True):
+        self._startup_phase_time = tracing.now()
+        self._startup_timings = []
+
         if hasattr(GLib, 'unix_signal_add'):
             GLib.unix_signal_add(
                 GLib.PRIORITY_DEFAULT, signal.SIGINT, self.close)
@@ -366,6 +438,11 @@ class Activity(Window, Gtk.Container):
         self.shared_activity = None
         self._join_id = None
         self._updating_jobject = False
+        self._save_pending = False
+        self._save_timeout_id = None
+        self._save_idle_id = None
+        self._last_save_time = 0
+        self._save_request_time = None
         self._closing = False
         self._quit_requested = False
         self._deleting = False
@@ -386,8 +463,26 @@ class Activity(Window, Gtk.Container):
         self.sugar_accel_group = accel_group
         self.add_accel_group(accel_group)
 
-        self._bus = ActivityService(self)
+        self._bus = None
         self._owns_file = False
+        self._original_title = None
+        self._busy_count = 0
+        self._stop_buttons = []
+
+        bundle = get_bundle_instance(get_bundle_path())
+        self.set_icon_from_file(bundle.get_icon())
+
+        self._first_draw_id = self.connect_after('draw',
+                                                 self.__first_draw_cb, handle)
+        if self.deferred_startup:
+            self.set_title(_('%s Activity') % get_bundle_name())
+        else:
+            self._complete_startup(handle)
+
+        self._log_startup_phase('init')
+
+    def _complete_startup(self, handle):
+        self._bus = ActivityService(self)
 
         share_scope = SCOPE_PRIVATE
 
@@ -398,17 +493,11 @@ class Activity(Window, Gtk.Container):
             if 'share-scope' in self._jobject.metadata:
                 share_scope = self._jobject.metadata['share-scope']
 
-            if 'launch-times' in self._jobject.metadata:
-                self._jobject.metadata['launch-times'] += ', %d' % \
-                    int(time.time())
-            else:
-                self._jobject.metadata['launch-times'] = \
-                    str(int(time.time()))
-
-            if 'spent-times' in self._jobject.metadata:
-                self._jobject.metadata['spent-times'] += ', 0'
-            else:
-                self._jobject.metadata['spent-times'] = '0'
+            _push_times_value(self._jobject.metadata, 'launch-times',
+                              int(time.time()), len)
+            _push_times_value(self._jobject.metadata, 'spent-times', 0,
+                              lambda dropped: sum(_times_to_int(v)
+                                                  for v in dropped))
         else:
             self._is_resumed = False
             self._jobject = self._initialize_journal_object()
@@ -421,7 +510,7 @@ class Activity(Window, Gtk.Container):
 
         if handle.invited:
             wait_loop = GObject.MainLoop()
-            self._client_handler = _ClientHandler(
+            self._client_handler = ClientHandler(
                 self.get_bundle_id(),
                 partial(self.__got_channel_cb, wait_loop))
             # FIXME: The current API requires that self.shared_activity is set
@@ -443,12 +532,6 @@ class Activity(Window, Gtk.Container):
                                            self.__jobject_updated_cb)
         self.set_title(self._jobject.metadata['title'])
 
-        bundle = get_bundle_instance(get_bundle_path())
-        self.set_icon_from_file(bundle.get_icon())
-
-        self._busy_count = 0
-        self._stop_buttons = []
-
         if self._is_resumed and get_save_as():
             # preserve original and use a copy for editing
             self._jobject_old = self._jobject
@@ -456,6 +539,41 @@ class Activity(Window, Gtk.Container):
 
         self._original_title = self._jobject.metadata['title']
 
+    def __first_draw_cb(self, window, cr, handle):
+        self.disconnect(self._first_draw_id)
+        self._first_draw_id = None
+        self._log_startup_phase('first-frame')
+
+        if self.deferred_startup:
+            GLib.idle_add(self.__deferred_startup_cb, handle)
+        else:
+            tracing.write()
+        return False
+
+    def __deferred_startup_cb(self, handle):
+        if self._closing:
+            return False
+
+        self._complete_startup(handle)
+        self._log_startup_phase('deferred-setup')
+        tracing.write()
+
+        if self.canvas is not None and self.canvas.get_mapped():
+            self._read_jobject_file()
+        return False
+
+    def _log_startup_phase(self, phase):
+        now = tracing.now()
+        if not self._startup_timings:
+            self._startup_timings.append(
+                ('import', _import_end_time - _import_start_time))
+        self._startup_timings.append((phase, now - self._startup_phase_time))
+        tracing.complete(phase, self._startup_phase_time, now)
+        self._startup_phase_time = now
+
+        logging.debug('Activity startup: %s' % ', '.join(
+            '%s %.3fs' % timing for timing in self._startup_timings))
+
     def add_stop_button(self, button):
         """
         Register an extra stop button.  Normally not required.  Use only
@@ -582,6 +700,7 @@ class Activity(Window, Gtk.Container):
             self._active = active
             self._update_spent_time()
             if not self._active and self._jobject:
+                # Saved right away, the activity may be killed soon
                 self.save()
 
     active = GObject.Property(
@@ -711,11 +830,14 @@ class Activity(Window, Gtk.Container):
 
     def __canvas_map_cb(self, canvas):
         logging.debug('Activity.__canvas_map_cb')
+        self._read_jobject_file()
+        canvas.disconnect_by_func(self.__canvas_map_cb)
+
+    def _read_jobject_file(self):
         if self._jobject and self._jobject.file_path and \
                 not self._read_file_called:
             self.read_file(self._jobject.file_path)
             self._read_file_called = True
-        canvas.disconnect_by_func(self.__canvas_map_cb)
 
     def __jobject_create_cb(self):
         pass
@@ -808,6 +930,27 @@ class Activity(Window, Gtk.Container):
     def __save_cb(self):
         logging.debug('Activity.__save_cb')
         self._updating_jobject = False
+        if self._save_pending:
+            self._save_pending = False
+            if self._closing or self._quit_requested:
+                # The state changed while writing, write it before leaving
+                try:
+                    self.save()
+                except:
+                    # pylint: disable=W0702
+                    logging.exception('Error saving activity object to '
+                                      'datastore')
+                    if self._quit_requested:
+                        self._session.will_quit(self, False)
+                    if self._closing:
+                        self._show_keep_failed_dialog()
+                        self._closing = False
+                    return
+                if self._updating_jobject:
+                    return
+            else:
+                self.schedule_save()
+
         if self._quit_requested:
             self._session.will_quit(self, True)
         elif self._closing:
@@ -816,6 +959,10 @@ class Activity(Window, Gtk.Container):
     def __save_error_cb(self, err):
         logging.debug('Activity.__save_error_cb')
         self._updating_jobject = False
+        if self._save_pending:
+            self._save_pending = False
+            if not self._closing:
+                self.schedule_save()
         if self._quit_requested:
             self._session.will_quit(self, False)
         if self._closing:
@@ -920,7 +1067,6 @@ class Activity(Window, Gtk.Container):
         public API of an activity, and should behave in standard ways. Use your
         own implementation of write_file() to save your activity specific data.
         '''
-
         if self._jobject is None:
             logging.debug('Cannot save, no journal object.')
             return
@@ -928,9 +1074,15 @@ class Activity(Window, Gtk.Container):
         logging.debug('Activity.save: %r' % self._jobject.object_id)
 
         if self._updating_jobject:
-            logging.info('Activity.save: still processing a previous request.')
+            logging.info('Activity.save: still processing a previous '
+                         'request, will save again when it is done.')
+            self._save_pending = True
             return
 
+        self._cancel_scheduled_save()
+        self._last_save_time = time.time()
+        self._save_request_time = None
+
         buddies_dict = self._get_buddies()
         if buddies_dict:
             self.metadata['buddies_id'] = json.dumps(buddies_dict.keys())
@@ -939,15 +1091,8 @@ class Activity(Window, Gtk.Container):
         # update spent time before saving
         self._update_spent_time()
 
-        def set_last_value(values_list, new_value):
-            if ', ' not in values_list:
-                return '%d' % new_value
-            else:
-                partial_list = ', '.join(values_list.split(', ')[:-1])
-                return partial_list + ', %d' % new_value
-
-        self.metadata['spent-times'] = set_last_value(
-            self.metadata['spent-times'], self._spent_time)
+        self.metadata['spent-times'] = _set_last_times_value(
+            str(self.metadata['spent-times']), self._spent_time)
 
         preview = self.get_preview()
         if preview is not None:
@@ -978,6 +1123,77 @@ class Activity(Window, Gtk.Container):
                             reply_handler=self.__save_cb,
                             error_handler=self.__save_error_cb)
 
+    def schedule_save(self, delay=None):
+        '''
+        Request that the activity be saved to the journal soon.
+
+        Unlike :meth:`save`, requests are coalesced: the save is
+        delayed until no new request arrived for `delay` milliseconds,
+        but no more than
+        :attr:`~sugar3.activity.activity.AUTOSAVE_MAX_DELAY`
+        milliseconds after the first pending request, autosaves start
+        at most once every
+        :attr:`~sugar3.activity.activity.AUTOSAVE_MIN_INTERVAL`
+        milliseconds, and requests made while a previous save is still
+        being written result in a single follow-up save.  The save
+        itself runs from an idle handler, so it does not delay user
+        input or drawing.
+
+        Activities may call this method every time their document
+        changes.
+
+        Args:
+            delay (int): milliseconds to wait for further requests,
+                default :attr:`~sugar3.activity.activity.AUTOSAVE_DELAY`
+        '''
+        if self._jobject is None or self._closing:
+            return
+
+        if self._updating_jobject:
+            self._save_pending = True
+            return
+
+        if delay is None:
+            delay = AUTOSAVE_DELAY
+
+        now = time.time()
+        if self._save_request_time is None:
+            self._save_request_time = now
+        waited = int((now - self._save_request_time) * 1000)
+        delay = max(0, min(delay, AUTOSAVE_MAX_DELAY - waited))
+
+        elapsed = int((time.time() - self._last_save_time) * 1000)
+        if 0 <= elapsed < AUTOSAVE_MIN_INTERVAL:
+            delay = max(delay, AUTOSAVE_MIN_INTERVAL - elapsed)
+
+        self._cancel_scheduled_save()
+        self._save_timeout_id = GLib.timeout_add(
+            delay, self.__save_timeout_cb)
+
+    def _cancel_scheduled_save(self):
+        if self._save_timeout_id is not None:
+            GLib.source_remove(self._save_timeout_id)
+            self._save_timeout_id = None
+        if self._save_idle_id is not None:
+            GLib.source_remove(self._save_idle_id)
+            self._save_idle_id = None
+
+    def __save_timeout_cb(self):
+        self._save_timeout_id = None
+        self._save_idle_id = GLib.idle_add(self.__save_idle_cb,
+                                           priority=GLib.PRIORITY_LOW)
+        return False
+
+    def __save_idle_cb(self):
+        self._save_idle_id = None
+        if not self._closing:
+            try:
+                self.save()
+            except:
+                # pylint: disable=W0702
+                logging.exception('Error saving activity object to datastore')
+        return False
+
     def copy(self):
         '''
         Make a copy of the journal object.
@@ -1269,6 +1485,7 @@ class Activity(Window, Gtk.Container):
         return True
 
     def _complete_close(self):
+        self._cancel_scheduled_save()
         self.destroy()
 
         if self.shared_activity:
@@ -1277,7 +1494,8 @@ class Activity(Window, Gtk.Container):
         self._cleanup_jobject()
 
         # Make the exported object inaccessible
-        dbus.service.Object.remove_from_connection(self._bus)
+        if self._bus is not None:
+            self._bus.remove_from_connection()
 
         self._session.unregister(self)
         power.get_power_manager().shutdown()
@@ -1310,7 +1528,7 @@ class Activity(Window, Gtk.Container):
         if not self.can_close():
             return
 
-        if get_save_as():
+        if get_save_as() and self._jobject is not None:
             if self._jobject.metadata['title'] != self._original_title:
                 self._do_close(skip_save)
             else:
@@ -1418,53 +1636,6 @@ class Activity(Window, Gtk.Container):
         Gdk.flush()
 
 
-class _ClientHandler(dbus.service.Object, DBusProperties):
-    def __init__(self, bundle_id, got_channel_cb):
-        self._interfaces = set([CLIENT, CLIENT_HANDLER, PROPERTIES_IFACE])
-        self._got_channel_cb = got_channel_cb
-
-        bus = dbus.Bus()
-        name = CLIENT + '.' + bundle_id
-        bus_name = dbus.service.BusName(name, bus=bus)
-
-        path = '/' + name.replace('.', '/')
-        dbus.service.Object.__init__(self, bus_name, path)
-        DBusProperties.__init__(self)
-
-        self._implement_property_get(CLIENT, {
-            'Interfaces': lambda: list(self._interfaces),
-        })
-        self._implement_property_get(CLIENT_HANDLER, {
-            'HandlerChannelFilter': self.__get_filters_cb,
-        })
-
-    def __get_filters_cb(self):
-        logging.debug('__get_filters_cb')
-        filters = {
-            CHANNEL + '.ChannelType': CHANNEL_TYPE_TEXT,
-            CHANNEL + '.TargetHandleType': CONNECTION_HANDLE_TYPE_CONTACT,
-        }
-        filter_dict = dbus.Dictionary(filters, signature='sv')
-        logging.debug('__get_filters_cb %r' % dbus.Array([filter_dict],
-                      signature='a{sv}'))
-        return dbus.Array([filter_dict], signature='a{sv}')
-
-    @dbus.service.method(dbus_interface=CLIENT_HANDLER,
-                         in_signature='ooa(oa{sv})aota{sv}', out_signature='')
-    def HandleChannels(self, account, connection, channels, requests_satisfied,
-                       user_action_time, handler_info):
-        logging.debug('HandleChannels\n\t%r\n\t%r\n\t%r\n\t%r\n\t%r\n\t%r' %
-                      (account, connection, channels, requests_satisfied,
-                          user_action_time, handler_info))
-        try:
-            for object_path, properties in channels:
-                channel_type = properties[CHANNEL + '.ChannelType']
-                handle_type = properties[CHANNEL + '.TargetHandleType']
-                if channel_type == CHANNEL_TYPE_TEXT:
-                    self._got_channel_cb(connection, object_path, handle_type)
-        except Exception, e:
-            logging.exception(e)
-
 _session = None
 
 
@@ -1553,3 +1724,8 @@ def get_bundle(bundle_id='', object_id=''):
         return bundle_from_dir(bundle_path)
     else:
         return None
+
+
+_import_end_time = tracing.now()
+tracing.complete('import sugar3.activity.activity', _import_start_time,
+                 _import_end_time)
@@ -20,6 +20,11 @@
 
 UNSTABLE. Activities are currently not allowed to run other activities so at
 the moment there is no reason to stabilize this API.
+
+When the SUGAR_ACTIVITY_ZYGOTE environment variable is set in the
+shell, the first launch starts `sugar-activity --zygote`, and the later
+launches of Python activities are forked by it instead of starting a
+new interpreter.
 """
 
 import logging
@@ -31,11 +36,14 @@ from gi.repository import GLib
 from sugar3.activity.activityhandle import ActivityHandle
 from sugar3 import util
 from sugar3 import env
+from sugar3 import tracing
 from sugar3.datastore import datastore
 
-from errno import EEXIST, ENOSPC
+from errno import EEXIST, ENOSPC, ENOENT, ECONNREFUSED
 
 import os
+import json
+import socket
 import subprocess
 
 _SHELL_SERVICE = 'org.laptop.Shell'
@@ -44,6 +52,11 @@ _SHELL_IFACE = 'org.laptop.Shell'
 
 _ACTIVITY_FACTORY_INTERFACE = 'org.laptop.ActivityFactory'
 
+ZYGOTE_VARIABLE = 'SUGAR_ACTIVITY_ZYGOTE'
+
+# Seconds to wait for the zygote to fork a launched activity
+ZYGOTE_TIMEOUT = 5
+
 # helper method to close all filedescriptors
 # borrowed from subprocess.py
 try:
@@ -220,11 +233,16 @@ class ActivityCreationHandler(GObject.GObject):
             error_handler=self._notify_launch_error_handler)
 
         environ = get_environment(self._bundle)
+        tracing.set_launch_environment(environ)
         (log_path, log_file) = open_log_file(self._bundle)
         command = get_command(self._bundle, self._handle.activity_id,
                               self._handle.object_id, self._handle.uri,
                               self._handle.invited)
 
+        if _zygote_launch(command, environ, str(self._bundle.get_path()),
+                          log_path, log_file, self._handle.activity_id):
+            return
+
         dev_null = file('/dev/null', 'r')
         child = subprocess.Popen([str(s) for s in command],
                                  env=environ,
@@ -296,9 +314,112 @@ def create_with_object_id(bundle, object_id):
     return ActivityCreationHandler(bundle, activity_handle)
 
 
+def _zygote_launch(command, environ, cwd, log_path, log_file, activity_id):
+    """Ask a running `sugar-activity --zygote` process to fork the
+    activity, which saves importing the toolkit again.
+
+    Returns False if the activity has to be launched the usual way.
+    """
+    if os.path.basename(command[0]) != 'sugar-activity':
+        return False
+
+    if not os.environ.get(ZYGOTE_VARIABLE):
+        return False
+
+    socket_path = env.get_zygote_socket_path()
+    if not os.path.exists(socket_path):
+        _start_zygote()
+        return False
+
+    request = {'argv': [str(s) for s in command],
+               'environ': environ,
+               'cwd': cwd,
+               'log_path': log_path}
+
+    # This runs in the shell main loop, do not wait for a stuck zygote
+    zygote = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    zygote.settimeout(ZYGOTE_TIMEOUT)
+    try:
+        zygote.connect(socket_path)
+    except socket.error, e:
+        zygote.close()
+        if e.errno not in (ECONNREFUSED, ENOENT):
+            logging.warning('Cannot connect to the zygote, falling back '
+                            'to a new process: %s' % e)
+            return False
+
+        # The socket was left behind by a zygote that exited
+        logging.warning('The zygote is not running, starting it again')
+        try:
+            os.unlink(socket_path)
+        except OSError:
+            pass
+        _start_zygote()
+        return False
+
+    try:
+        zygote.sendall(json.dumps(request) + '\n')
+        reply = zygote.makefile('r')
+        pid = int(reply.readline())
+    except (socket.error, ValueError, UnicodeError), e:
+        logging.warning('Cannot launch through the zygote, falling back '
+                        'to a new process: %s' % e)
+        zygote.close()
+        return False
+    zygote.settimeout(None)
+
+    logging.debug('launched %r through the zygote, pid %s' % (command, pid))
+
+    # The zygote sends the wait status of the child when it exits
+    GLib.io_add_watch(zygote.fileno(), GLib.IO_IN | GLib.IO_HUP,
+                      _zygote_watch_cb,
+                      (zygote, reply, pid, log_file, activity_id))
+    return True
+
+
+def _start_zygote():
+    logging.debug('Starting the activity zygote')
+    try:
+        subprocess.Popen(['sugar-activity', '--zygote'], close_fds=True)
+    except OSError, e:
+        logging.error('Cannot start the activity zygote: %s' % e)
+
+
+def _zygote_watch_cb(fd, condition, user_data):
+    zygote, reply, pid, log_file, activity_id = user_data
+
+    try:
+        status = int(reply.readline())
+    except (socket.error, ValueError):
+        logging.error('Lost the zygote while activity %s was running' %
+                      activity_id)
+        log_file.close()
+        _notify_launch_failure(activity_id)
+    else:
+        _child_exited(pid, status, log_file, activity_id)
+    finally:
+        reply.close()
+        zygote.close()
+
+    return False
+
+
 def _child_watch_cb(pid, condition, user_data):
     log_file, activity_id = user_data
 
+    # try to reap zombies in case SIGCHLD has not been set to SIG_IGN
+    try:
+        os.waitpid(pid, 0)
+    except OSError:
+        # SIGCHLD = SIG_IGN, no zombies
+        pass
+
+    _child_exited(pid, condition, log_file, activity_id)
+
+
+def _child_exited(pid, condition, log_file, activity_id):
+    user_data = (log_file, activity_id)
+
     if os.WIFEXITED(condition):
         status = os.WEXITSTATUS(condition)
         signum = None
@@ -317,29 +438,26 @@ def _child_watch_cb(pid, condition, user_data):
     finally:
         log_file.close()
 
-    # try to reap zombies in case SIGCHLD has not been set to SIG_IGN
-    try:
-        os.waitpid(pid, 0)
-    except OSError:
-        # SIGCHLD = SIG_IGN, no zombies
-        pass
-
     if status or signum:
-        # XXX have to recreate dbus object since we can't reuse
-        # ActivityCreationHandler's one, see
-        # https://bugs.freedesktop.org/show_bug.cgi?id=23507
-        bus = dbus.SessionBus()
-        bus_object = bus.get_object(_SHELL_SERVICE, _SHELL_PATH)
-        shell = dbus.Interface(bus_object, _SHELL_IFACE)
+        _notify_launch_failure(activity_id)
 
-        def reply_handler_cb(*args):
-            pass
 
-        def error_handler_cb(error):
-            logging.error('Cannot send NotifyLaunchFailure to the shell')
+def _notify_launch_failure(activity_id):
+    # XXX have to recreate dbus object since we can't reuse
+    # ActivityCreationHandler's one, see
+    # https://bugs.freedesktop.org/show_bug.cgi?id=23507
+    bus = dbus.SessionBus()
+    bus_object = bus.get_object(_SHELL_SERVICE, _SHELL_PATH)
+    shell = dbus.Interface(bus_object, _SHELL_IFACE)
+
+    def reply_handler_cb(*args):
+        pass
+
+    def error_handler_cb(error):
+        logging.error('Cannot send NotifyLaunchFailure to the shell')
 
-        # TODO send launching failure but activity could already show
-        # main window, see http://bugs.sugarlabs.org/ticket/1447#comment:19
-        shell.NotifyLaunchFailure(activity_id,
-                                  reply_handler=reply_handler_cb,
-                                  error_handler=error_handler_cb)
+    # TODO send launching failure but activity could already show
+    # main window, see http://bugs.sugarlabs.org/ticket/1447#comment:19
+    shell.NotifyLaunchFailure(activity_id,
+                              reply_handler=reply_handler_cb,
+                              error_handler=error_handler_cb)
@@ -23,6 +23,15 @@ import logging
 
 import dbus
 import dbus.service
+from dbus import PROPERTIES_IFACE
+from telepathy.server import DBusProperties
+from telepathy.interfaces import CHANNEL, \
+    CHANNEL_TYPE_TEXT, \
+    CLIENT, \
+    CLIENT_HANDLER
+from telepathy.constants import CONNECTION_HANDLE_TYPE_CONTACT
+
+from sugar3 import tracing
 
 
 _ACTIVITY_SERVICE_NAME = 'org.laptop.Activity'
@@ -49,6 +58,7 @@ class ActivityService(dbus.service.Object):
         The various methods exposed on dbus are just forwarded
         to the client Activity object's equally-named methods.
         """
+        tracing.begin('ActivityService')
         activity.realize()
 
         activity_id = activity.get_id()
@@ -60,6 +70,7 @@ class ActivityService(dbus.service.Object):
         dbus.service.Object.__init__(self, bus_name, object_path)
 
         self._activity = activity
+        tracing.end('ActivityService')
 
     @dbus.service.method(_ACTIVITY_INTERFACE)
     def SetActive(self, active):
@@ -81,3 +92,53 @@ class ActivityService(dbus.service.Object):
             self._activity.get_document_path(async_cb, async_err_cb)
         except Exception, e:
             async_err_cb(e)
+
+
+class ClientHandler(dbus.service.Object, DBusProperties):
+    """Telepathy client handler that receives the channel of an invite."""
+
+    def __init__(self, bundle_id, got_channel_cb):
+        self._interfaces = set([CLIENT, CLIENT_HANDLER, PROPERTIES_IFACE])
+        self._got_channel_cb = got_channel_cb
+
+        bus = dbus.Bus()
+        name = CLIENT + '.' + bundle_id
+        bus_name = dbus.service.BusName(name, bus=bus)
+
+        path = '/' + name.replace('.', '/')
+        dbus.service.Object.__init__(self, bus_name, path)
+        DBusProperties.__init__(self)
+
+        self._implement_property_get(CLIENT, {
+            'Interfaces': lambda: list(self._interfaces),
+        })
+        self._implement_property_get(CLIENT_HANDLER, {
+            'HandlerChannelFilter': self.__get_filters_cb,
+        })
+
+    def __get_filters_cb(self):
+        logging.debug('__get_filters_cb')
+        filters = {
+            CHANNEL + '.ChannelType': CHANNEL_TYPE_TEXT,
+            CHANNEL + '.TargetHandleType': CONNECTION_HANDLE_TYPE_CONTACT,
+        }
+        filter_dict = dbus.Dictionary(filters, signature='sv')
+        logging.debug('__get_filters_cb %r' % dbus.Array([filter_dict],
+                      signature='a{sv}'))
+        return dbus.Array([filter_dict], signature='a{sv}')
+
+    @dbus.service.method(dbus_interface=CLIENT_HANDLER,
+                         in_signature='ooa(oa{sv})aota{sv}', out_signature='')
+    def HandleChannels(self, account, connection, channels, requests_satisfied,
+                       user_action_time, handler_info):
+        logging.debug('HandleChannels\n\t%r\n\t%r\n\t%r\n\t%r\n\t%r\n\t%r' %
+                      (account, connection, channels, requests_satisfied,
+                          user_action_time, handler_info))
+        try:
+            for object_path, properties in channels:
+                channel_type = properties[CHANNEL + '.ChannelType']
+                handle_type = properties[CHANNEL + '.TargetHandleType']
+                if channel_type == CHANNEL_TYPE_TEXT:
+                    self._got_channel_cb(connection, object_path, handle_type)
+        except Exception, e:
+            logging.exception(e)
@@ -27,53 +27,397 @@ is setup by creating a `setup.py` file in the project with the following::
 '''
 
 import argparse
+import ast
+import fcntl
+import json
+import multiprocessing
 import operator
 import os
+import struct
 import sys
+import time
 import zipfile
+import zlib
 import tarfile
-import unittest
 import shutil
 import subprocess
 import re
-import gettext
+import hashlib
 import logging
+import tempfile
 from glob import glob
-from fnmatch import fnmatch
+from itertools import izip
+from multiprocessing.pool import ThreadPool
+from fnmatch import translate
 from ConfigParser import ConfigParser
 import xml.etree.cElementTree as ET
 from HTMLParser import HTMLParser
 
 from sugar3 import env
 from sugar3.bundle.activitybundle import ActivityBundle
+from sugar3.test import discover
 
 
 IGNORE_DIRS = ['dist', '.git', 'screenshots']
 IGNORE_FILES = ['.gitignore', 'MANIFEST', '*.pyc', '*~', '*.bak', 'pseudo.po']
 
 
+INSTALL_THREADS = 4
+LINK_MODES = ['hardlink', 'reflink']
+
+_FICLONE = 0x40049409
+
+# Files in these formats are already compressed, and are stored in the
+# .xo as they are
+STORED_EXTENSIONS = ['.png', '.jpg', '.jpeg', '.gif', '.ogg', '.oga', '.ogv',
+                     '.mp3', '.mp4', '.webm', '.zip', '.xo', '.gz', '.bz2',
+                     '.xz', '.woff', '.woff2']
+
+# Files bigger than this are compressed while they are written, instead
+# of being read whole by a worker process
+STREAMED_FILE_SIZE = 4 * 1024 * 1024
+
+# Maximum size of the files read by the worker processes and not yet
+# written to the .xo
+MAX_PENDING_SIZE = 64 * 1024 * 1024
+
+_ZIPFILE_INTERNALS = ['fp', 'filelist', 'NameToInfo', '_didModify',
+                      '_writecheck']
+
+
+_matchers = {}
+
+
+def _get_matcher(patterns):
+    # A single regular expression for all the patterns
+    key = tuple(patterns)
+    if key not in _matchers:
+        expression = '|'.join('(?:%s)' % translate(pattern)
+                              for pattern in patterns)
+        _matchers[key] = re.compile(expression).match
+    return _matchers[key]
+
+
 def list_files(base_dir, ignore_dirs=None, ignore_files=None):
     result = []
 
     base_dir = os.path.abspath(base_dir)
+    ignore_dirs = set(ignore_dirs or [])
+    match = None
+    if ignore_files:
+        match = _get_matcher(ignore_files)
 
     for root, dirs, files in os.walk(base_dir):
-        if ignore_files:
-            for pattern in ignore_files:
-                files = [f for f in files if not fnmatch(f, pattern)]
-
         rel_path = root[len(base_dir) + 1:]
         for f in files:
-            result.append(os.path.join(rel_path, f))
+            if match is None or match(f) is None:
+                result.append(os.path.join(rel_path, f))
 
-        if ignore_dirs and root == base_dir:
-            for ignore in ignore_dirs:
-                if ignore in dirs:
-                    dirs.remove(ignore)
+        if ignore_dirs:
+            dirs[:] = [d for d in dirs if d not in ignore_dirs]
 
     return result
 
 
+def _git_ls_files(cwd, options=None):
+    # Returns None when git fails, raises OSError when it is missing
+    git_ls = subprocess.Popen(['git', 'ls-files', '-z'] + (options or []),
+                              stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                              cwd=cwd)
+    stdout, stderr_ = git_ls.communicate()
+    if git_ls.returncode:
+        return None
+    # pylint: disable=E1103
+    return [path for path in stdout.split('\0') if path]
+
+
+def _git_ls_submodule_files(cwd, paths):
+    # For git before 2.11, which lists the submodules as plain paths
+    files = []
+    for path in paths:
+        sub_path = os.path.join(cwd, path)
+        if os.path.isdir(sub_path) \
+           and os.path.exists(os.path.join(sub_path, '.git')):
+            sub_files = _git_ls_files(sub_path) or []
+            for f in _git_ls_submodule_files(sub_path, sub_files):
+                files.append(os.path.join(path, f))
+        else:
+            files.append(path)
+    return files
+
+
+_PO_ESCAPE_RE = re.compile(r'\\(x[0-9a-fA-F]+|[0-7]{1,3}|.)')
+_PO_ESCAPES = {'n': '\n', 't': '\t', 'r': '\r', 'a': '\a', 'b': '\b',
+               'f': '\f', 'v': '\v', '\\': '\\', '"': '"', '?': '?'}
+_PO_KEYWORD_RE = re.compile(r'^(msgctxt|msgid_plural|msgid|msgstr(?:\[\d+\])?)'
+                            r'\s+(".*")$')
+
+
+def _po_unescape(match):
+    escape = match.group(1)
+    if escape in _PO_ESCAPES:
+        return _PO_ESCAPES[escape]
+    elif escape[0] == 'x':
+        return chr(int(escape[1:], 16) & 0xff)
+    elif escape[0] in '01234567':
+        return chr(int(escape, 8) & 0xff)
+    raise ValueError('invalid escape sequence \\%s' % escape)
+
+
+def _read_po(po_file):
+    """Read the messages of a .po file that msgfmt would compile.
+
+    Returns:
+        dict: the translations by .mo key; the key of a message is its
+        msgid, prefixed by its msgctxt and \\x04, and followed by \\0
+        and its msgid_plural; plural translations are joined with \\0
+    """
+    messages = {}
+    entry = {}
+    fuzzy = False
+    field = None
+
+    def add_entry(entry, fuzzy):
+        if 'msgid' not in entry:
+            return
+        key = entry['msgid']
+        if 'msgctxt' in entry:
+            key = '%s\x04%s' % (entry['msgctxt'], key)
+        if 'msgid_plural' in entry:
+            key = '%s\0%s' % (key, entry['msgid_plural'])
+            translations = sorted((int(name[7:-1]), value)
+                                  for name, value in entry.items()
+                                  if name.startswith('msgstr['))
+            msgstr = '\0'.join(value for index_, value in translations)
+        else:
+            msgstr = entry.get('msgstr', '')
+
+        # Like msgfmt, skip untranslated and fuzzy messages, but not
+        # a fuzzy header
+        if not msgstr or msgstr.startswith('\0'):
+            return
+        if fuzzy and (entry['msgid'] or 'msgctxt' in entry):
+            return
+        if key in messages:
+            raise ValueError('duplicate message definition %r' % key)
+        messages[key] = msgstr
+
+    with open(po_file) as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if line.startswith('"') and field is not None:
+                value = line
+            elif not line or line.startswith('#'):
+                if field is not None and field.startswith('msgstr'):
+                    add_entry(entry, fuzzy)
+                    entry = {}
+                    fuzzy = False
+                    field = None
+                if line.startswith('#,') and 'fuzzy' in \
+                        [flag.strip() for flag in line[2:].split(',')]:
+                    fuzzy = True
+                continue
+            else:
+                match = _PO_KEYWORD_RE.match(line)
+                if match is None:
+                    raise ValueError('%s:%d: syntax error' %
+                                     (po_file, line_number))
+                field, value = match.groups()
+                if field in ('msgctxt', 'msgid') and \
+                        any(name.startswith('msgstr') for name in entry):
+                    add_entry(entry, fuzzy)
+                    entry = {}
+                    fuzzy = False
+                if field in entry:
+                    raise ValueError('%s:%d: duplicate %s' %
+                                     (po_file, line_number, field))
+                entry[field] = ''
+
+            if len(value) < 2 or not value.endswith('"'):
+                raise ValueError('%s:%d: syntax error' %
+                                 (po_file, line_number))
+            try:
+                entry[field] += _PO_ESCAPE_RE.sub(_po_unescape, value[1:-1])
+            except ValueError, e:
+                raise ValueError('%s:%d: %s' % (po_file, line_number, e))
+
+    if field is not None:
+        add_entry(entry, fuzzy)
+    return messages
+
+
+def _hash_string(string):
+    # hashpjw, as used by msgfmt and libintl for the .mo hash table
+    hval = 0
+    for char in string.split('\0', 1)[0]:
+        hval = ((hval << 4) + ord(char)) & 0xffffffff
+        g = hval & 0xf0000000
+        if g:
+            hval ^= g >> 24
+            hval ^= g
+    return hval
+
+
+def _is_prime(candidate):
+    # Same approximate test as msgfmt, for the same table sizes
+    divisor = 3
+    square = divisor * divisor
+    while square < candidate and candidate % divisor != 0:
+        divisor += 1
+        square += 4 * divisor
+        divisor += 1
+    return candidate % divisor != 0
+
+
+def _write_mo(messages, mo_file):
+    """Write messages, as returned by _read_po(), to a .mo file with the
+    messages sorted and hashed as msgfmt does."""
+    keys = sorted(messages, key=lambda key: key.split('\0', 1)[0])
+    count = len(keys)
+
+    hash_size = (count * 4) / 3 | 1
+    while not _is_prime(hash_size):
+        hash_size += 2
+    hash_size = max(hash_size, 3)
+
+    hash_table = [0] * hash_size
+    for i, key in enumerate(keys):
+        hash_value = _hash_string(key)
+        index = hash_value % hash_size
+        if hash_table[index] != 0:
+            increment = 1 + (hash_value % (hash_size - 2))
+            while hash_table[index] != 0:
+                if index >= hash_size - increment:
+                    index -= hash_size - increment
+                else:
+                    index += increment
+        hash_table[index] = i + 1
+
+    originals_offset = 28
+    translations_offset = originals_offset + 8 * count
+    hash_offset = translations_offset + 8 * count
+    offset = hash_offset + 4 * hash_size
+
+    originals = []
+    for key in keys:
+        originals.append((len(key), offset))
+        offset += len(key) + 1
+    translations = []
+    for key in keys:
+        translations.append((len(messages[key]), offset))
+        offset += len(messages[key]) + 1
+
+    with open(mo_file, 'wb') as f:
+        f.write(struct.pack('<7I', 0x950412de, 0, count, originals_offset,
+                            translations_offset, hash_size, hash_offset))
+        for table in (originals, translations):
+            for length, string_offset in table:
+                f.write(struct.pack('<2I', length, string_offset))
+        f.write(struct.pack('<%dI' % hash_size, *hash_table))
+        for key in keys:
+            f.write(key + '\0')
+        for key in keys:
+            f.write(messages[key] + '\0')
+
+
+def _compile_po(job):
+    po_file, mo_file, msgids = job
+    try:
+        messages = _read_po(po_file)
+        _write_mo(messages, mo_file)
+    except (IOError, ValueError), e:
+        return None, 'cannot compile %s: %s' % (po_file, e)
+
+    # Same lookup as gettext, without reading the .mo back
+    translations = []
+    for msgid in msgids:
+        translations.append(messages.get(msgid, msgid))
+    return translations, None
+
+
+def _compress_member(source_path):
+    with open(source_path, 'rb') as f:
+        data = f.read()
+    crc = zlib.crc32(data) & 0xffffffff
+
+    if _get_compress_type(source_path) == zipfile.ZIP_DEFLATED:
+        compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION,
+                                      zlib.DEFLATED, -15)
+        compressed = compressor.compress(data) + compressor.flush()
+        if len(compressed) < len(data):
+            return compressed, crc, len(data), zipfile.ZIP_DEFLATED
+
+    return data, crc, len(data), zipfile.ZIP_STORED
+
+
+def _get_compress_type(source_path):
+    extension = os.path.splitext(source_path)[1].lower()
+    if extension in STORED_EXTENSIONS:
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+
+def _write_compressed_member(zip_file, source_path, arcname, data, crc,
+                             file_size, compress_type):
+    # Same as ZipFile.write(), for data compressed by _compress_member().
+    # This uses the internals of the zipfile module of Python 2.7, when
+    # they are missing the file is compressed again by ZipFile.write().
+    # pylint: disable=W0212
+    if not all(hasattr(zip_file, name) for name in _ZIPFILE_INTERNALS):
+        zip_file.write(source_path, arcname,
+                       _get_compress_type(source_path))
+        return
+
+    st = os.stat(source_path)
+    zinfo = zipfile.ZipInfo(arcname, time.localtime(st.st_mtime)[0:6])
+    zinfo.external_attr = (st.st_mode & 0xFFFF) << 16L
+    zinfo.compress_type = compress_type
+    zinfo.file_size = file_size
+    zinfo.compress_size = len(data)
+    zinfo.CRC = crc
+    zinfo.flag_bits = 0x00
+    zinfo.header_offset = zip_file.fp.tell()
+    zip_file._writecheck(zinfo)
+    zip_file._didModify = True
+
+    zip64 = zinfo.file_size > zipfile.ZIP64_LIMIT or \
+        zinfo.compress_size > zipfile.ZIP64_LIMIT
+    zip_file.fp.write(zinfo.FileHeader(zip64))
+    zip_file.fp.write(data)
+    zip_file.filelist.append(zinfo)
+    zip_file.NameToInfo[zinfo.filename] = zinfo
+
+
+def _reflink(source, dest):
+    # Share the data of the files, on file systems like btrfs or xfs
+    with open(source, 'rb') as source_file:
+        with open(dest, 'wb') as dest_file:
+            fcntl.ioctl(dest_file.fileno(), _FICLONE, source_file.fileno())
+    shutil.copymode(source, dest)
+
+
+def _install_file(job):
+    source, dest, link = job
+
+    # Never write through a link to the source made by a previous install
+    if os.path.lexists(dest):
+        os.unlink(dest)
+
+    if link is not None:
+        try:
+            if link == 'hardlink':
+                os.link(source, dest)
+            else:
+                _reflink(source, dest)
+            return os.path.getsize(dest), True
+        except (IOError, OSError):
+            # On another file system, or not supported by this one
+            pass
+
+    shutil.copy(source, dest)
+    return os.path.getsize(dest), False
+
+
 class Config(object):
 
     def __init__(self, source_dir, dist_dir=None, dist_name=None):
@@ -92,6 +436,7 @@ class Config(object):
         self.tar_name = None
         self.summary = None
         self.description = None
+        self.source_files = None
 
         self.update()
 
@@ -120,6 +465,10 @@ class Builder(object):
         self.config = config
         self._no_fail = no_fail
         self.locale_dir = os.path.join(self.config.build_dir, 'locale')
+        # Under the dist dir, which is ignored like the other build
+        # outputs, instead of leaving a new directory in the checkout
+        self.cache_dir = os.path.join(self.config.dist_dir, '.cache',
+                                      'locale')
 
     def build(self):
         self.build_locale()
@@ -131,44 +480,144 @@ class Builder(object):
             logging.warn('Missing po/ dir, cannot build_locale')
             return
 
-        if os.path.exists(self.locale_dir):
-            shutil.rmtree(self.locale_dir)
-
+        languages = []
         for f in sorted(os.listdir(po_dir)):
-            if not f.endswith('.po') or f == 'pseudo.po':
-                continue
+            if f.endswith('.po') and f != 'pseudo.po':
+                languages.append(f[:-3])
+
+        # Keep the files built for the existing languages, they are only
+        # rebuilt when their sources change
+        if os.path.isdir(self.locale_dir):
+            for lang in os.listdir(self.locale_dir):
+                if lang not in languages:
+                    shutil.rmtree(os.path.join(self.locale_dir, lang))
+
+        outdated = [lang for lang in languages
+                    if not self._is_language_built(lang)]
+        if not outdated:
+            return
 
-            file_name = os.path.join(po_dir, f)
-            lang = f[:-3]
+        cache_paths = {}
+        for lang in languages:
+            po_file = self._get_language_paths(lang)[0]
+            cache_paths[lang] = self._get_cache_path(po_file)
+        self._prune_cache(cache_paths.values())
 
-            localedir = os.path.join(self.config.build_dir, 'locale', lang)
-            mo_path = os.path.join(localedir, 'LC_MESSAGES')
+        jobs = []
+        for lang in outdated:
+            po_file, mo_file, linfo_file = self._get_language_paths(lang)
+            mo_path = os.path.dirname(mo_file)
             if not os.path.isdir(mo_path):
                 os.makedirs(mo_path)
 
-            mo_file = os.path.join(mo_path, '%s.mo' % self.config.bundle_id)
-            args = ['msgfmt', '--output-file=%s' % mo_file, file_name]
-            retcode = subprocess.call(args)
-            if retcode:
-                print 'ERROR - msgfmt failed with return code %i.' % retcode
+            cache_path = cache_paths[lang]
+            if os.path.isdir(cache_path):
+                shutil.copyfile(os.path.join(cache_path, 'messages.mo'),
+                                mo_file)
+                shutil.copyfile(os.path.join(cache_path, 'activity.linfo'),
+                                linfo_file)
+            else:
+                jobs.append((lang, cache_path))
+
+        if not jobs:
+            return
+
+        msgids = [self.config.activity_name, self.config.summary]
+        pool = multiprocessing.Pool(min(len(jobs),
+                                        multiprocessing.cpu_count()))
+        try:
+            results = pool.map(
+                _compile_po,
+                [self._get_language_paths(lang)[:2] + (msgids,)
+                 for lang, cache_path_ in jobs])
+        finally:
+            pool.close()
+            pool.join()
+
+        for (lang, cache_path), (translations, error) in zip(jobs, results):
+            if error is not None:
+                print 'ERROR - %s' % error
                 if self._no_fail:
                     continue
+                sys.exit(1)
+
+            self._write_linfo(lang, *translations)
+            po_file, mo_file, linfo_file = self._get_language_paths(lang)
+            self._store_in_cache(cache_path, mo_file, linfo_file)
+
+    def _get_language_paths(self, lang):
+        po_file = os.path.join(self.config.source_dir, 'po', '%s.po' % lang)
+        localedir = os.path.join(self.locale_dir, lang)
+        mo_file = os.path.join(localedir, 'LC_MESSAGES',
+                               '%s.mo' % self.config.bundle_id)
+        linfo_file = os.path.join(localedir, 'activity.linfo')
+        return po_file, mo_file, linfo_file
+
+    def _is_language_built(self, lang):
+        po_file, mo_file, linfo_file = self._get_language_paths(lang)
+        info_file = os.path.join(self.config.source_dir, 'activity',
+                                 'activity.info')
+        try:
+            source_mtime = max(os.stat(po_file).st_mtime,
+                               os.stat(info_file).st_mtime)
+            built_mtime = min(os.stat(mo_file).st_mtime,
+                              os.stat(linfo_file).st_mtime)
+        except OSError:
+            return False
+        return built_mtime >= source_mtime
+
+    def _get_cache_path(self, po_file):
+        # The built files only depend on these inputs
+        digest = hashlib.sha1()
+        with open(po_file, 'rb') as f:
+            digest.update(f.read())
+        for value in (self.config.bundle_id, self.config.activity_name,
+                      self.config.summary):
+            digest.update('\0%s' % (value or ''))
+        return os.path.join(self.cache_dir, digest.hexdigest())
+
+    def _prune_cache(self, cache_paths):
+        # Drop the entries that no current po file produced, otherwise
+        # every change to the translations would leave one behind
+        if not os.path.isdir(self.cache_dir):
+            return
 
-            cat = gettext.GNUTranslations(open(mo_file, 'r'))
-            translated_name = cat.gettext(self.config.activity_name)
-            translated_summary = cat.gettext(self.config.summary)
-            if translated_summary is None:
-                translated_summary = ''
-            if translated_summary.find('\n') > -1:
-                translated_summary = translated_summary.replace('\n', '')
-                logging.warn(
-                    'Translation of summary on file %s have \\n chars. '
-                    'Should be removed' % file_name)
-            linfo_file = os.path.join(localedir, 'activity.linfo')
-            f = open(linfo_file, 'w')
-            f.write('[Activity]\nname = %s\n' % translated_name)
-            f.write('summary = %s\n' % translated_summary)
-            f.close()
+        for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if path not in cache_paths:
+                shutil.rmtree(path, ignore_errors=True)
+
+    def _store_in_cache(self, cache_path, mo_file, linfo_file):
+        if not os.path.isdir(self.cache_dir):
+            try:
+                os.makedirs(self.cache_dir)
+            except OSError:
+                # Created by another thread meanwhile
+                pass
+
+        temp_path = tempfile.mkdtemp(dir=self.cache_dir)
+        shutil.copyfile(mo_file, os.path.join(temp_path, 'messages.mo'))
+        shutil.copyfile(linfo_file, os.path.join(temp_path, 'activity.linfo'))
+        try:
+            os.rename(temp_path, cache_path)
+        except OSError:
+            # Already stored for another language with the same inputs
+            shutil.rmtree(temp_path)
+
+    def _write_linfo(self, lang, translated_name, translated_summary):
+        file_name, mo_file_, linfo_file = self._get_language_paths(lang)
+
+        if translated_summary is None:
+            translated_summary = ''
+        if translated_summary.find('\n') > -1:
+            translated_summary = translated_summary.replace('\n', '')
+            logging.warn(
+                'Translation of summary on file %s have \\n chars. '
+                'Should be removed' % file_name)
+        f = open(linfo_file, 'w')
+        f.write('[Activity]\nname = %s\n' % translated_name)
+        f.write('summary = %s\n' % translated_summary)
+        f.close()
 
     def get_locale_files(self):
         return list_files(self.locale_dir, IGNORE_DIRS, IGNORE_FILES)
@@ -183,50 +632,42 @@ class Packager(object):
         if not os.path.exists(self.config.dist_dir):
             os.mkdir(self.config.dist_dir)
 
-    def get_files_in_git(self, root=None):
-        if root is None:
-            root = self.config.source_dir
+    def get_files_in_git(self):
+        # Listed once per build, for all the packagers
+        if self.config.source_files is None:
+            self.config.source_files = self._list_source_files()
+        return self.config.source_files
 
-        git_ls = None
+    def _list_source_files(self):
+        source_dir = self.config.source_dir
+        paths = None
         try:
-            git_ls = subprocess.Popen(['git', 'ls-files'],
-                                      stdout=subprocess.PIPE,
-                                      cwd=root)
+            paths = _git_ls_files(source_dir, ['--recurse-submodules'])
+            if paths is None:
+                # Either not a git repository, or git is older than 2.11
+                # and does not know --recurse-submodules
+                paths = _git_ls_files(source_dir)
+                if paths is None:
+                    logging.warn('Packager: this is not a git repository, '
+                                 'fall back to filtered list')
+                else:
+                    paths = _git_ls_submodule_files(source_dir, paths)
         except OSError:
             logging.warn('Packager: git is not installed, '
                          'fall back to filtered list')
 
-        if git_ls is not None:
-            stdout, _ = git_ls.communicate()
-            if git_ls.returncode:
-                # Fall back to filtered list
-                logging.warn('Packager: this is not a git repository, '
-                             'fall back to filtered list')
-            elif stdout:
-                # pylint: disable=E1103
-                git_output = [path.strip() for path in
-                              stdout.strip('\n').split('\n')]
-                files = []
-                for line in git_output:
-                    ignore = False
-                    for directory in IGNORE_DIRS:
-                        if line.startswith(directory + '/'):
-                            ignore = True
-                            break
-                    if not ignore:
-                        sub_path = os.path.join(root, line)
-                        if os.path.isdir(sub_path) \
-                           and os.path.exists(os.path.join(sub_path, '.git')):
-                            sub_list = self.get_files_in_git(sub_path)
-                            for f in sub_list:
-                                files.append(os.path.join(line, f))
-                        else:
-                            files.append(line)
-
-                for pattern in IGNORE_FILES:
-                    files = [f for f in files if not fnmatch(f, pattern)]
-
-                return files
+        if paths:
+            ignore_dirs = set(IGNORE_DIRS)
+            match = _get_matcher(IGNORE_FILES)
+            files = []
+            for path in paths:
+                if match(path) is not None:
+                    continue
+                # Only the top level directories are ignored
+                if '/' in path and path.split('/', 1)[0] in ignore_dirs:
+                    continue
+                files.append(path)
+            return files
 
         return list_files(self.config.source_dir,
                           IGNORE_DIRS, IGNORE_FILES)
@@ -246,17 +687,52 @@ class XOPackager(Packager):
         bundle_zip = zipfile.ZipFile(self.package_path, 'w',
                                      zipfile.ZIP_DEFLATED)
 
+        members = []
         for f in self.get_files_in_git():
-            bundle_zip.write(os.path.join(self.config.source_dir, f),
-                             os.path.join(self.config.bundle_root_dir, f))
+            members.append((os.path.join(self.config.source_dir, f),
+                            os.path.join(self.config.bundle_root_dir, f)))
 
         for f in self.builder.get_locale_files():
-            bundle_zip.write(os.path.join(self.builder.locale_dir, f),
-                             os.path.join(self.config.bundle_root_dir,
-                                          'locale', f))
+            members.append((os.path.join(self.builder.locale_dir, f),
+                            os.path.join(self.config.bundle_root_dir,
+                                         'locale', f)))
+
+        # Compress in worker processes, write in order in this one
+        pool = multiprocessing.Pool()
+        try:
+            batch = []
+            batch_size = 0
+            for source, arcname in members:
+                size = os.path.getsize(source)
+                if size > STREAMED_FILE_SIZE:
+                    self._write_batch(bundle_zip, pool, batch)
+                    batch = []
+                    batch_size = 0
+                    bundle_zip.write(source, arcname,
+                                     _get_compress_type(source))
+                    continue
+
+                if batch_size + size > MAX_PENDING_SIZE:
+                    self._write_batch(bundle_zip, pool, batch)
+                    batch = []
+                    batch_size = 0
+                batch.append((source, arcname))
+                batch_size += size
+
+            self._write_batch(bundle_zip, pool, batch)
+        finally:
+            pool.close()
+            pool.join()
 
         bundle_zip.close()
 
+    def _write_batch(self, bundle_zip, pool, batch):
+        compressed = pool.imap(_compress_member,
+                               [source for source, arcname_ in batch],
+                               chunksize=8)
+        for (source, arcname), result in izip(batch, compressed):
+            _write_compressed_member(bundle_zip, source, arcname, *result)
+
 
 class SourcePackager(Packager):
 
@@ -278,7 +754,8 @@ class Installer(Packager):
         Packager.__init__(self, builder.config)
         self.builder = builder
 
-    def install(self, prefix, install_mime=True, install_desktop_file=True):
+    def install(self, prefix, install_mime=True, install_desktop_file=True,
+                link=None):
         self.builder.build()
 
         activity_path = os.path.join(prefix, 'share', 'sugar', 'activities',
@@ -301,14 +778,26 @@ class Installer(Packager):
 
             source_to_dest[source_path] = dest_path
 
-        for source, dest in source_to_dest.items():
-            print 'Install %s to %s.' % (source, dest)
-
-            path = os.path.dirname(dest)
+        for path in set(os.path.dirname(dest)
+                        for dest in source_to_dest.values()):
             if not os.path.exists(path):
                 os.makedirs(path)
 
-            shutil.copy(source, dest)
+        pool = ThreadPool(INSTALL_THREADS)
+        try:
+            results = pool.map(_install_file,
+                               [(source, dest, link)
+                                for source, dest in source_to_dest.items()])
+        finally:
+            pool.close()
+            pool.join()
+
+        size = sum(file_size for file_size, linked_ in results)
+        print 'Installed %d files, %d bytes, to %s.' % \
+            (len(results), size, prefix)
+        if link is not None:
+            linked = len([l for file_size_, l in results if l])
+            print '%d of them are %ss of the source files.' % (linked, link)
 
         if install_mime:
             self.config.bundle.install_mime_type(self.config.source_dir)
@@ -440,17 +929,17 @@ def cmd_check(config, options):
 
         # Run Tests
         if os.path.isdir(unit_test_path) and run_unit_test:
-            all_tests = unittest.defaultTestLoader.discover(unit_test_path)
-            unittest.TextTestRunner(verbosity=options.verbose).run(all_tests)
+            discover.run_tests(unit_test_path, options.jobs, options.verbose,
+                               paths=[config.source_dir])
         elif not run_unit_test:
             print "Not running unit tests"
         else:
             print 'No "unit" directory found.'
 
         if os.path.isdir(integration_test_path) and run_integration_test:
-            all_tests = unittest.defaultTestLoader.discover(
-                integration_test_path)
-            unittest.TextTestRunner(verbosity=options.verbose).run(all_tests)
+            # These use the session bus and the shell, never in parallel
+            discover.run_tests(integration_test_path,
+                               verbosity=options.verbose)
         elif not run_integration_test:
             print "Not running integration tests"
         else:
@@ -506,11 +995,193 @@ def cmd_install(config, options):
     """Install the activity in the system"""
 
     installer = Installer(Builder(config))
-    installer.install(options.prefix, options.install_mime, options.install_desktop_file)
+    installer.install(options.prefix, options.install_mime,
+                      options.install_desktop_file, options.link)
 
 
 def _po_escape(string):
-    return re.sub('([\\\\"])', '\\\\\\1', string)
+    string = re.sub('([\\\\"])', '\\\\\\1', string)
+    return string.replace('\n', '\\n').replace('\t', '\\t')
+
+
+# Same keywords as xgettext --language=Python --keyword=_, with the
+# positions of the msgid and msgid_plural arguments
+GETTEXT_KEYWORDS = {'_': (0, None), 'gettext': (0, None),
+                    'ugettext': (0, None), 'dgettext': (1, None),
+                    'ngettext': (0, 1), 'ungettext': (0, 1),
+                    'dngettext': (1, 2)}
+TRANS_COMMENT = 'TRANS:'
+GENPOT_CACHE_VERSION = 1
+
+_PYTHON_FORMAT_RE = re.compile(r'%(?:\([^)]*\))?[#0 +-]*(?:\*|\d+)?'
+                               r'(?:\.(?:\*|\d+))?[hlL]?([diouxXeEfFgGcrs%])')
+
+
+def _is_python_format(string):
+    directives = 0
+    position = string.find('%')
+    while position != -1:
+        match = _PYTHON_FORMAT_RE.match(string, position)
+        if match is None:
+            return False
+        if match.group(1) != '%':
+            directives += 1
+        position = string.find('%', match.end())
+    return directives > 0
+
+
+def _get_string(node):
+    if not isinstance(node, ast.Str):
+        return None
+    if isinstance(node.s, unicode):
+        return node.s
+    return node.s.decode('utf-8', 'replace')
+
+
+def _get_trans_comments(lines, lineno):
+    # The comment block just above the line, from its TRANS: comment
+    block = []
+    index = lineno - 2
+    while index >= 0 and lines[index].lstrip().startswith('#'):
+        block.insert(0, lines[index].lstrip()[1:].strip())
+        index -= 1
+    for i, comment in enumerate(block):
+        if comment.startswith(TRANS_COMMENT):
+            return block[i:]
+    return []
+
+
+def _extract_messages(path):
+    """Extract the translatable strings of a python file, as xgettext
+    does.
+
+    Returns:
+        list: [lineno, msgid, msgid_plural, comments, python_format]
+        lists, in source order; the strings are unicode
+    """
+    try:
+        with open(path) as f:
+            source = f.read()
+        tree = ast.parse(source, path)
+    except (IOError, SyntaxError, TypeError), e:
+        logging.warn('Cannot extract the strings of %s: %s', path, e)
+        return []
+
+    lines = source.splitlines()
+    messages = []
+    for node in ast.walk(tree):
+        if not isinstance(node, ast.Call):
+            continue
+        if isinstance(node.func, ast.Name):
+            name = node.func.id
+        elif isinstance(node.func, ast.Attribute):
+            name = node.func.attr
+        else:
+            continue
+        if name not in GETTEXT_KEYWORDS:
+            continue
+
+        msgid_index, plural_index = GETTEXT_KEYWORDS[name]
+        if len(node.args) <= max(msgid_index, plural_index):
+            continue
+        msgid = _get_string(node.args[msgid_index])
+        if not msgid:
+            continue
+        plural = None
+        if plural_index is not None:
+            plural = _get_string(node.args[plural_index])
+            if plural is None:
+                continue
+
+        python_format = _is_python_format(msgid) or \
+            (plural is not None and _is_python_format(plural))
+        messages.append([node.args[msgid_index].lineno, msgid, plural,
+                         _get_trans_comments(lines, node.lineno),
+                         python_format])
+
+    messages.sort(key=operator.itemgetter(0))
+    return messages
+
+
+def _write_po_string(f, keyword, string):
+    string = string.encode('utf-8')
+    if '\n' not in string[:-1]:
+        f.write('%s "%s"\n' % (keyword, _po_escape(string)))
+        return
+
+    f.write('%s ""\n' % keyword)
+    for line in string.splitlines(True):
+        f.write('"%s"\n' % _po_escape(line))
+
+
+def _write_pot(pot_file, entries):
+    f = open(pot_file, 'w')
+    f.write('# SOME DESCRIPTIVE TITLE.\n'
+            '# Copyright (C) YEAR THE PACKAGE\'S COPYRIGHT HOLDER\n'
+            '# This file is distributed under the same license as the '
+            'PACKAGE package.\n'
+            '# FIRST AUTHOR <EMAIL@ADDRESS>, YEAR.\n'
+            '#\n'
+            '#, fuzzy\n'
+            'msgid ""\n'
+            'msgstr ""\n'
+            '"Project-Id-Version: PACKAGE VERSION\\n"\n'
+            '"Report-Msgid-Bugs-To: \\n"\n'
+            '"POT-Creation-Date: %s\\n"\n'
+            '"PO-Revision-Date: YEAR-MO-DA HO:MI+ZONE\\n"\n'
+            '"Last-Translator: FULL NAME <EMAIL@ADDRESS>\\n"\n'
+            '"Language-Team: LANGUAGE <LL@li.org>\\n"\n'
+            '"Language: \\n"\n'
+            '"MIME-Version: 1.0\\n"\n'
+            '"Content-Type: text/plain; charset=UTF-8\\n"\n'
+            '"Content-Transfer-Encoding: 8bit\\n"\n'
+            % time.strftime('%Y-%m-%d %H:%M%z'))
+
+    for msgid, plural, references, comments, python_format in entries:
+        f.write('\n')
+        for comment in comments:
+            f.write('#. %s\n' % comment.encode('utf-8'))
+        line = '#:'
+        for reference in references:
+            if len(line) + len(reference) >= 79 and line != '#:':
+                f.write(line + '\n')
+                line = '#:'
+            line += ' ' + reference
+        f.write(line + '\n')
+        if python_format:
+            f.write('#, python-format\n')
+        _write_po_string(f, 'msgid', msgid)
+        if plural is None:
+            f.write('msgstr ""\n')
+        else:
+            _write_po_string(f, 'msgid_plural', plural)
+            f.write('msgstr[0] ""\nmsgstr[1] ""\n')
+    f.close()
+
+
+def _load_genpot_cache(cache_file):
+    try:
+        with open(cache_file) as f:
+            data = json.load(f)
+    except (IOError, ValueError):
+        return {}
+    if not isinstance(data, dict) or \
+            data.get('version') != GENPOT_CACHE_VERSION:
+        return {}
+    return data.get('files', {})
+
+
+def _save_genpot_cache(cache_file, files):
+    cache_dir = os.path.dirname(cache_file)
+    try:
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        fd, temp_path = tempfile.mkstemp(dir=cache_dir, prefix='.genpot')
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'version': GENPOT_CACHE_VERSION, 'files': files}, f)
+        os.rename(temp_path, cache_file)
+    except (IOError, OSError), e:
+        logging.warn('Could not write the genpot cache: %s', e)
 
 
 def cmd_genpot(config, options):
@@ -523,30 +1194,68 @@ def cmd_genpot(config, options):
         os.mkdir(po_path)
 
     python_files = []
-    for root, dirs_dummy, files in os.walk(config.source_dir):
-        for file_name in files:
-            if file_name.endswith('.py'):
-                file_path = os.path.relpath(os.path.join(root, file_name),
-                                            config.source_dir)
-                python_files.append(file_path)
+    for file_path in list_files(config.source_dir, IGNORE_DIRS, IGNORE_FILES):
+        if file_path.endswith('.py'):
+            python_files.append(file_path)
     python_files.sort()
 
-    # First write out a stub .pot file containing just the translated
-    # activity name, then have xgettext merge the rest of the
-    # translations into that. (We can't just append the activity name
-    # to the end of the .pot file afterwards, because that might
-    # create a duplicate msgid.)
-    pot_file = os.path.join('po', '%s.pot' % config.bundle_name)
-    escaped_name = _po_escape(config.activity_name)
-    f = open(pot_file, 'w')
-    f.write('#: activity/activity.info:2\n')
-    f.write('msgid "%s"\n' % escaped_name)
-    f.write('msgstr ""\n')
+    # The strings of each file are kept with its modification time and
+    # size, so only the files changed since the last run are scanned
+    cache_file = os.path.join(config.dist_dir, '.cache', 'genpot.json')
+    cache = _load_genpot_cache(cache_file)
+    files = {}
+    changed_files = []
+    for file_path in python_files:
+        st = os.stat(file_path)
+        stamp = [st.st_mtime, st.st_size]
+        cached = cache.get(file_path)
+        if cached is not None and cached[0] == stamp:
+            files[file_path] = cached
+        else:
+            files[file_path] = [stamp, None]
+            changed_files.append(file_path)
+
+    if changed_files:
+        pool = multiprocessing.Pool(min(len(changed_files),
+                                        multiprocessing.cpu_count()))
+        try:
+            results = pool.map(_extract_messages, changed_files)
+        finally:
+            pool.close()
+            pool.join()
+        for file_path, messages in zip(changed_files, results):
+            files[file_path][1] = messages
+        _save_genpot_cache(cache_file, files)
+
+    # The activity name, summary and description come first, the
+    # strings found in several places are merged in a single entry
+    entries = []
+    entries_by_msgid = {}
+
+    def add_entry(msgid, plural, reference, comments, python_format):
+        entry = entries_by_msgid.get(msgid)
+        if entry is None:
+            entry = [msgid, plural, [], [], False]
+            entries_by_msgid[msgid] = entry
+            entries.append(entry)
+        if entry[1] is None:
+            entry[1] = plural
+        if reference not in entry[2]:
+            entry[2].append(reference)
+        for comment in comments:
+            if comment not in entry[3]:
+                entry[3].append(comment)
+        entry[4] = entry[4] or python_format
+
+    def add_info_entry(string, line):
+        if not isinstance(string, unicode):
+            string = string.decode('utf-8')
+        add_entry(string, None,
+                  'activity/activity.info:%d' % line, [], False)
+
+    add_info_entry(config.activity_name, 2)
     if config.summary is not None:
-        escaped_summary = _po_escape(config.summary)
-        f.write('#: activity/activity.info:3\n')
-        f.write('msgid "%s"\n' % escaped_summary)
-        f.write('msgstr ""\n')
+        add_info_entry(config.summary, 3)
 
     if config.description is not None:
         parser = HTMLParser()
@@ -557,18 +1266,16 @@ def cmd_genpot(config, options):
         for s in strings:
             s = s.strip()
             if s:
-                f.write('#: activity/activity.info:4\n')
-                f.write('msgid "%s"\n' % _po_escape(s))
-                f.write('msgstr ""\n')
-    f.close()
+                add_info_entry(s, 4)
 
-    args = ['xgettext', '--join-existing', '--language=Python',
-            '--keyword=_', '--add-comments=TRANS:', '--output=%s' % pot_file]
+    for file_path in python_files:
+        for lineno, msgid, plural, comments, python_format in \
+                files[file_path][1]:
+            add_entry(msgid, plural, '%s:%d' % (file_path, lineno),
+                      comments, python_format)
 
-    args += python_files
-    retcode = subprocess.call(args)
-    if retcode:
-        print 'ERROR - xgettext failed with return code %i.' % retcode
+    pot_file = os.path.join('po', '%s.pot' % config.bundle_name)
+    _write_pot(pot_file, entries)
 
 
 def cmd_build(config, options):
@@ -596,6 +1303,10 @@ def start():
         "--skip-install-desktop-file", dest="install_desktop_file",
         action="store_false", default=True,
         help="Skip the installation of desktop file in the system")
+    install_parser.add_argument(
+        "--link", dest="link", choices=LINK_MODES, default=None,
+        help="Hardlink or reflink the files instead of copying them, "
+             "when the prefix is on the same file system")
 
     check_parser = subparsers.add_parser(
         "check", help="Run tests for the activity")
@@ -606,6 +1317,11 @@ def start():
                               type=int, choices=range(0, 3),
                               default=1, nargs='?',
                               help="verbosity for the unit tests")
+    check_parser.add_argument("--jobs", "-j", dest="jobs", type=int,
+                              nargs='?', default=1,
+                              const=multiprocessing.cpu_count(),
+                              help="number of processes running the unit "
+                                   "tests, the number of CPUs if not given")
 
     dist_parser = subparsers.add_parser("dist_xo",
                                         help="Create a xo bundle package")
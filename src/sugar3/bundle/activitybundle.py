@@ -21,6 +21,7 @@ UNSTABLE.
 """
 
 from ConfigParser import ConfigParser, ParsingError
+from contextlib import contextmanager
 from locale import normalize
 import os
 import shutil
@@ -28,6 +29,7 @@ import tempfile
 import logging
 
 from sugar3 import env
+from sugar3.bundle import bundleindex
 from sugar3.bundle.bundle import Bundle, \
     MalformedBundleException, NotInstalledException
 from sugar3.bundle.bundleversion import NormalizedVersion
@@ -36,6 +38,44 @@ from sugar3.bundle.bundleversion import InvalidVersionError
 
 _bundle_instances = {}
 
+# Expanded languages, by locale environment variable value
+_languages = {}
+
+# Mime directories to update when the current batch_install() exits
+_mime_batch = None
+
+# ActivityBundle attributes stored in the bundle index
+_INDEXED_FIELDS = ['bundle_exec', '_name', '_icon', '_bundle_id',
+                   '_mime_types', '_show_launcher', '_tags',
+                   '_activity_version', '_summary', '_description',
+                   '_single_instance', '_max_participants']
+
+
+def _get_locale_variable():
+    # Same precedence as gettext.py
+    for envar in ('LANGUAGE', 'LC_ALL', 'LC_MESSAGES', 'LANG'):
+        val = os.environ.get(envar)
+        if val:
+            return val
+    return None
+
+
+def _get_languages():
+    """Get the normalized and expanded languages of the locale, most
+    preferred first, computed once per locale setting."""
+    val = _get_locale_variable()
+    if val not in _languages:
+        # Using method from gettext.py
+        nelangs = []
+        for lang in (val or '').split(':'):
+            if not lang:
+                continue
+            for nelang in _expand_lang(lang):
+                if nelang not in nelangs:
+                    nelangs.append(nelang)
+        _languages[val] = nelangs
+    return _languages[val]
+
 
 def _expand_lang(locale):
     # Private method from gettext.py
@@ -115,18 +155,47 @@ class ActivityBundle(Bundle):
         self._single_instance = False
         self._max_participants = 0
 
+        index = None
+        if self._zip_file is None and bundleindex.is_indexed(path):
+            index = bundleindex.get_index()
+            locale = _get_locale_variable() if translated else None
+            fields = index.lookup(path, locale)
+            if fields is not None:
+                self._set_fields(fields)
+                _bundle_instances[path] = self
+                return
+
         info_file = self.get_file('activity/activity.info')
         if info_file is None:
             raise MalformedBundleException('No activity.info file')
-        self._parse_info(info_file)
+        try:
+            self._parse_info(info_file)
+        finally:
+            info_file.close()
 
+        linfo_path = None
         if translated:
-            linfo_file = self._get_linfo_file()
-            if linfo_file:
-                self._parse_linfo(linfo_file)
+            linfo_path = self._get_linfo_path()
+            if linfo_path:
+                linfo_file = self.get_file(linfo_path)
+                try:
+                    self._parse_linfo(linfo_file)
+                finally:
+                    linfo_file.close()
+
+        if index is not None:
+            index.store(path, locale, self._get_fields(), linfo_path)
 
         _bundle_instances[path] = self
 
+    def _get_fields(self):
+        return dict((field, getattr(self, field))
+                    for field in _INDEXED_FIELDS)
+
+    def _set_fields(self, fields):
+        for field in _INDEXED_FIELDS:
+            setattr(self, field, fields[field])
+
     def _parse_info(self, info_file):
         cp = ConfigParser()
         cp.readfp(info_file)
@@ -224,28 +293,24 @@ class ActivityBundle(Bundle):
                 'Activity bundle %s does not specify a license' %
                 self.get_path())
 
-    def _get_linfo_file(self):
-        # Using method from gettext.py, first find languages from environ
-        languages = []
-        for envar in ('LANGUAGE', 'LC_ALL', 'LC_MESSAGES', 'LANG'):
-            val = os.environ.get(envar)
-            if val:
-                languages = val.split(':')
-                break
+    def _get_linfo_path(self):
+        languages = _get_languages()
+        if not languages:
+            return None
 
-        # Next, normalize and expand the languages
-        nelangs = []
-        for lang in languages:
-            for nelang in _expand_lang(lang):
-                if nelang not in nelangs:
-                    nelangs.append(nelang)
+        if self._zip_file is None:
+            # One listdir instead of a failed open per candidate
+            try:
+                available = set(os.listdir(os.path.join(self._path,
+                                                        'locale')))
+            except OSError:
+                return None
+            languages = [lang for lang in languages if lang in available]
 
-        # Finally, select a language
-        for lang in nelangs:
+        for lang in languages:
             linfo_path = os.path.join('locale', lang, 'activity.linfo')
-            linfo_file = self.get_file(linfo_path)
-            if linfo_file is not None:
-                return linfo_file
+            if self.is_file(linfo_path):
+                return linfo_path
         return None
 
     def _parse_linfo(self, linfo_file):
@@ -288,20 +353,35 @@ class ActivityBundle(Bundle):
         return self._bundle_id
 
     def get_icon(self):
-        """Get the activity icon name"""
-        # FIXME: this should return the icon data, not a filename, so that
-        # we don't need to create a temp file in the zip case
+        """Get the activity icon file name.
+
+        For a zipped bundle the icon is written to a temporary file; use
+        :meth:`get_icon_data` instead to avoid it.
+        """
         icon_path = os.path.join('activity', self._icon + '.svg')
         if self._zip_file is None:
             return os.path.join(self.get_path(), icon_path)
         else:
-            icon_data = self.get_file(icon_path).read()
+            icon_data = self.get_icon_data()
             temp_file, temp_file_path = tempfile.mkstemp(prefix=self._icon,
                                                          suffix='.svg')
             os.write(temp_file, icon_data)
             os.close(temp_file)
             return temp_file_path
 
+    def get_icon_data(self):
+        """Get the SVG data of the activity icon, read straight from the
+        bundle, for the icon_data property of
+        :class:`sugar3.graphics.icon.Icon`."""
+        icon_file = self.get_file(os.path.join('activity',
+                                               self._icon + '.svg'))
+        if icon_file is None:
+            return None
+        try:
+            return icon_file.read()
+        finally:
+            icon_file.close()
+
     def get_icon_filename(self):
         '''Get the icon file name'''
         return self._icon + '.svg'
@@ -346,10 +426,10 @@ class ActivityBundle(Bundle):
         """Get whether there should be a visible launcher for the activity"""
         return self._show_launcher
 
-    def install(self):
+    def install(self, progress_cb=None):
         install_dir = env.get_user_activities_path()
 
-        self._unzip(install_dir)
+        self._unzip(install_dir, progress_cb)
 
         install_path = os.path.join(install_dir, self._zip_root_dir)
         self.install_mime_type(install_path)
@@ -371,8 +451,7 @@ class ActivityBundle(Bundle):
             installed_mime_path = os.path.join(mime_pkg_dir,
                                                '%s.xml' % self._bundle_id)
             self._symlink(mime_path, installed_mime_path)
-            os.spawnlp(os.P_WAIT, 'update-mime-database',
-                       'update-mime-database', mime_dir)
+            _update_mime_database(mime_dir)
 
         mime_types = self.get_mime_types()
         if mime_types is not None:
@@ -423,8 +502,7 @@ class ActivityBundle(Bundle):
                                            '%s.xml' % self._bundle_id)
         if os.path.exists(installed_mime_path):
             os.remove(installed_mime_path)
-            os.spawnlp(os.P_WAIT, 'update-mime-database',
-                       'update-mime-database', mime_dir)
+            _update_mime_database(mime_dir)
 
         mime_types = self.get_mime_types()
         if mime_types is not None:
@@ -450,6 +528,43 @@ class ActivityBundle(Bundle):
         return self.get_path().startswith(env.get_user_activities_path())
 
 
+def _update_mime_database(mime_dir):
+    if _mime_batch is not None:
+        _mime_batch.add(mime_dir)
+    else:
+        os.spawnlp(os.P_WAIT, 'update-mime-database',
+                   'update-mime-database', mime_dir)
+
+
+@contextmanager
+def batch_install():
+    """Defer the mime database updates of the bundles installed or
+    uninstalled in the block, and run them once when it exits.
+
+    Usage::
+
+        with batch_install():
+            for path in paths:
+                ActivityBundle(path).install()
+
+    Blocks can be nested; the updates run when the outermost exits.
+    """
+    global _mime_batch
+
+    if _mime_batch is not None:
+        yield
+        return
+
+    _mime_batch = set()
+    try:
+        yield
+    finally:
+        mime_dirs = _mime_batch
+        _mime_batch = None
+        for mime_dir in mime_dirs:
+            _update_mime_database(mime_dir)
+
+
 def get_bundle_instance(path, translated=True):
     global _bundle_instances
     if path not in _bundle_instances:
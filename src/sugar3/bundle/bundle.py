@@ -20,11 +20,21 @@
 UNSTABLE.
 """
 
+import bisect
 import os
 import logging
 import shutil
-import StringIO
+import stat
+import tempfile
 import zipfile
+import zlib
+from multiprocessing.pool import ThreadPool
+
+# Number of threads decompressing bundle members
+EXTRACT_THREADS = 4
+
+_ZIP_SYSTEM_UNIX = 3
+_COPY_BUFFER_SIZE = 64 * 1024
 
 
 class AlreadyInstalledException(Exception):
@@ -69,6 +79,7 @@ class Bundle(object):
         self._path = path
         self._zip_root_dir = None
         self._zip_file = None
+        self._zip_names = None
         self._installation_time = os.stat(path).st_mtime
 
         if not os.path.isdir(self._path):
@@ -103,11 +114,15 @@ class Bundle(object):
                     'directory whose name ends with %r' %
                     self._unzipped_extension)
 
-        for file_name in file_names:
-            if not file_name.startswith(self._zip_root_dir):
-                raise MalformedBundleException(
-                    'All files in the bundle must be inside a single ' +
-                    'top-level directory')
+        # Sorted names, to find the members under a directory by
+        # bisection; every name lies between the first and the last one,
+        # so checking those checks them all
+        self._zip_names = sorted(file_names)
+        if not self._zip_names[0].startswith(self._zip_root_dir) or \
+                not self._zip_names[-1].startswith(self._zip_root_dir):
+            raise MalformedBundleException(
+                'All files in the bundle must be inside a single ' +
+                'top-level directory')
 
     def get_file(self, filename):
         f = None
@@ -122,8 +137,7 @@ class Bundle(object):
         else:
             path = os.path.join(self._zip_root_dir, filename)
             try:
-                data = self._zip_file.read(path)
-                f = StringIO.StringIO(data)
+                f = self._zip_file.open(path)
             except KeyError:
                 logging.debug('%s not found in zip %s.' % (filename, path))
                 return None
@@ -149,10 +163,9 @@ class Bundle(object):
             return os.path.isdir(path)
         else:
             path = os.path.join(self._zip_root_dir, filename, "")
-            for f in self._zip_file.namelist():
-                if f.startswith(path):
-                    return True
-            return False
+            i = bisect.bisect_left(self._zip_names, path)
+            return i < len(self._zip_names) and \
+                self._zip_names[i].startswith(path)
 
     def get_path(self):
         """Get the bundle path."""
@@ -166,24 +179,166 @@ class Bundle(object):
     def get_show_launcher(self):
         return True
 
-    def _unzip(self, install_dir):
+    def _unzip(self, install_dir, progress_cb=None):
+        """Extract the bundle in install_dir.
+
+        The members are decompressed by a pool of threads into a
+        temporary directory, which then replaces any previous version of
+        the bundle, so a failure never leaves a partial installation.
+        Files of the previous version with the same size, CRC-32 and
+        permissions as the new member are hard linked instead of being
+        written again.
+
+        Args:
+            install_dir (str): directory where the bundle directory is
+                created
+            progress_cb (callable): called in the calling thread as
+                progress_cb(extracted_bytes, total_bytes) after each file;
+                extraction is cancelled if it returns False
+        """
         if self._zip_file is None:
             raise AlreadyInstalledException
 
         if not os.path.isdir(install_dir):
             os.mkdir(install_dir, 0775)
 
-        # zipfile provides API that in theory would let us do this
-        # correctly by hand, but handling all the oddities of
-        # Windows/UNIX mappings, extension attributes, deprecated
-        # features, etc makes it impractical.
-        if os.spawnlp(os.P_WAIT, 'unzip', 'unzip', '-o', self._path,
-                      '-x', 'mimetype', '-d', install_dir):
-            # clean up install dir after failure
-            shutil.rmtree(os.path.join(install_dir, self._zip_root_dir),
-                          ignore_errors=True)
-            # indicate failure.
+        install_path = os.path.join(install_dir, self._zip_root_dir)
+        previous_dir = None
+        if os.path.isdir(install_path) and not os.path.islink(install_path):
+            previous_dir = install_dir
+
+        # Hidden, so that it is not taken for an installed bundle, and in
+        # install_dir, so that it is moved in place atomically
+        temp_dir = tempfile.mkdtemp(prefix='.' + self._zip_root_dir,
+                                    dir=install_dir)
+        try:
+            self._extract(temp_dir, progress_cb, previous_dir)
+            self._replace(os.path.join(temp_dir, self._zip_root_dir),
+                          install_path)
+        except (IOError, OSError, zipfile.error), e:
+            logging.error('Error extracting %s: %s', self._path, e)
             raise ZipExtractException
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    def _get_member_path(self, root_dir, info):
+        name = info.filename
+        if os.path.isabs(name) or '..' in name.split('/'):
+            raise ZipExtractException('Unsafe path %r in %s' %
+                                      (name, self._path))
+        return os.path.join(root_dir, name)
+
+    def _extract(self, root_dir, progress_cb, previous_dir=None):
+        files = []
+        for info in self._zip_file.infolist():
+            if info.filename == 'mimetype':
+                continue
+            path = self._get_member_path(root_dir, info)
+            if info.filename.endswith('/'):
+                if not os.path.isdir(path):
+                    os.makedirs(path, 0775)
+            else:
+                directory = os.path.dirname(path)
+                if not os.path.isdir(directory):
+                    os.makedirs(directory, 0775)
+                previous_path = None
+                if previous_dir is not None:
+                    previous_path = self._get_member_path(previous_dir, info)
+                files.append((info, path, previous_path))
+
+        total_size = sum(member[0].file_size for member in files)
+        extracted_size = 0
+        reused = 0
+
+        pool = ThreadPool(min(EXTRACT_THREADS, max(len(files), 1)))
+        try:
+            for info, linked in pool.imap_unordered(self._extract_member,
+                                                    files):
+                extracted_size += info.file_size
+                reused += linked
+                if progress_cb is not None and \
+                        progress_cb(extracted_size, total_size) is False:
+                    raise ZipExtractException('Extraction cancelled')
+        finally:
+            pool.terminate()
+            pool.join()
+
+        if previous_dir is not None:
+            logging.debug('Reused %d of %d files of the installed %s',
+                          reused, len(files), self._zip_root_dir)
+
+    def _link_unchanged(self, info, mode, path, previous_path):
+        try:
+            previous_stat = os.lstat(previous_path)
+        except OSError:
+            return False
+        if not stat.S_ISREG(previous_stat.st_mode) or \
+                previous_stat.st_size != info.file_size:
+            return False
+        if mode & 0777 and \
+                stat.S_IMODE(previous_stat.st_mode) != mode & 0777:
+            return False
+
+        crc = 0
+        with open(previous_path, 'rb') as f:
+            while True:
+                data = f.read(_COPY_BUFFER_SIZE)
+                if not data:
+                    break
+                crc = zlib.crc32(data, crc)
+        if crc & 0xffffffff != info.CRC:
+            return False
+
+        try:
+            os.link(previous_path, path)
+        except OSError:
+            return False
+        return True
+
+    def _extract_member(self, member):
+        info, path, previous_path = member
+
+        mode = info.external_attr >> 16
+        if info.create_system != _ZIP_SYSTEM_UNIX:
+            mode = 0
+
+        if previous_path is not None and not stat.S_ISLNK(mode) and \
+                self._link_unchanged(info, mode, path, previous_path):
+            return info, True
+
+        if stat.S_ISLNK(mode):
+            os.symlink(self._zip_file.read(info), path)
+            return info, False
+
+        # ZipFile.open() opens its own file object for each member when
+        # the archive was opened from a path, so members can be read
+        # concurrently
+        source = self._zip_file.open(info)
+        try:
+            with open(path, 'wb') as target:
+                shutil.copyfileobj(source, target, _COPY_BUFFER_SIZE)
+        finally:
+            source.close()
+
+        # Like unzip, without the setuid, setgid and sticky bits
+        if mode & 0777:
+            os.chmod(path, mode & 0777)
+        return info, False
+
+    def _replace(self, source, target):
+        # The previous version is moved next to source, in the temporary
+        # directory that is removed after extraction
+        old_path = None
+        if os.path.lexists(target):
+            old_path = os.path.join(os.path.dirname(source), '.old')
+            os.rename(target, old_path)
+
+        try:
+            os.rename(source, target)
+        except OSError:
+            if old_path is not None:
+                os.rename(old_path, target)
+            raise
 
     def _zip(self, bundle_path):
         if self._zip_file is not None:
@@ -0,0 +1,237 @@
+# Copyright (C) 2016, Sugar Labs
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+"""Persistent index of the parsed activity bundle metadata
+
+The fields parsed from activity.info and activity.linfo are stored in
+the profile directory, keyed by the bundle path, for the bundles
+installed in the activities directories only.  An entry is only used
+for the same locale, and while the modification times of the bundle
+and locale directories and the size and modification time of
+activity.info and of the activity.linfo that was parsed are unchanged.
+
+UNSTABLE.
+"""
+
+import atexit
+import json
+import logging
+import os
+import tempfile
+
+from sugar3 import env
+
+INDEX_FILE = 'bundle-index.json'
+INDEX_VERSION = 3
+
+_index = None
+
+
+def _get_stamp(bundle_path, linfo_path):
+    try:
+        bundle_stat = os.stat(bundle_path)
+        info_stat = os.stat(os.path.join(bundle_path, 'activity',
+                                         'activity.info'))
+    except OSError:
+        return None
+    stamp = [bundle_stat.st_mtime, info_stat.st_mtime, info_stat.st_size]
+
+    # Adding or removing a language can change the activity.linfo used
+    try:
+        stamp.append(os.stat(os.path.join(bundle_path,
+                                          'locale')).st_mtime)
+    except OSError:
+        stamp.append(None)
+
+    # The translation in use can be updated in place
+    if linfo_path is not None:
+        try:
+            linfo_stat = os.stat(os.path.join(bundle_path, linfo_path))
+        except OSError:
+            return None
+        stamp.extend([linfo_stat.st_mtime, linfo_stat.st_size])
+    return stamp
+
+
+def _encode(value):
+    # json loads every string as unicode, the parsers give utf-8 str
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    if isinstance(value, list):
+        return [_encode(item) for item in value]
+    if isinstance(value, dict):
+        return dict((_encode(key), _encode(item))
+                    for key, item in value.items())
+    return value
+
+
+def get_activities_paths():
+    """Get the directories where activity bundles are installed, the
+    user one first."""
+    paths = [env.get_user_activities_path()]
+
+    data_dirs = os.environ.get('XDG_DATA_DIRS', '/usr/local/share:/usr/share')
+    for data_dir in data_dirs.split(':'):
+        if data_dir:
+            paths.append(os.path.join(data_dir, 'sugar', 'activities'))
+    return paths
+
+
+def is_indexed(bundle_path):
+    """Get whether the metadata of a bundle directory is kept in the
+    index, which is the case for the installed bundles."""
+    directory = os.path.dirname(os.path.abspath(bundle_path))
+    return directory in [os.path.abspath(path)
+                         for path in get_activities_paths()]
+
+
+class BundleIndex(object):
+    """An index of the parsed metadata of activity bundles, stored in a
+    single file."""
+
+    def __init__(self, path=None):
+        if path is None:
+            path = env.get_profile_path(INDEX_FILE)
+        self._path = path
+        self._entries = None
+        self._dirty = False
+
+    def _load(self):
+        if self._entries is not None:
+            return
+
+        self._entries = {}
+        try:
+            with open(self._path) as f:
+                data = json.load(f)
+        except (IOError, ValueError):
+            return
+
+        if isinstance(data, dict) and data.get('version') == INDEX_VERSION:
+            self._entries = _encode(data.get('bundles', {}))
+
+    def lookup(self, bundle_path, locale):
+        """Get the fields stored for a bundle directory, or None if they
+        are missing or out of date."""
+        self._load()
+        bundle_path = os.path.abspath(bundle_path)
+        entry = self._entries.get(bundle_path)
+        if entry is None or entry['locale'] != locale:
+            return None
+        if entry['stamp'] != _get_stamp(bundle_path, entry['linfo']):
+            return None
+        return entry['fields']
+
+    def store(self, bundle_path, locale, fields, linfo_path=None):
+        """Store the fields parsed from a bundle directory.
+
+        Args:
+            linfo_path (str): the path of the activity.linfo parsed for
+                the locale, relative to the bundle, or None
+        """
+        self._load()
+        bundle_path = os.path.abspath(bundle_path)
+        stamp = _get_stamp(bundle_path, linfo_path)
+        if stamp is None:
+            return
+        self._entries[bundle_path] = {'stamp': stamp,
+                                      'locale': locale,
+                                      'linfo': linfo_path,
+                                      'fields': fields}
+        self._dirty = True
+
+    def remove(self, bundle_path):
+        """Forget a bundle directory."""
+        self._load()
+        bundle_path = os.path.abspath(bundle_path)
+        if self._entries.pop(bundle_path, None) is not None:
+            self._dirty = True
+
+    def get_bundle_paths(self):
+        """Get the paths of the indexed bundles."""
+        self._load()
+        return self._entries.keys()
+
+    def save(self):
+        """Write the index, if it changed since it was loaded."""
+        if not self._dirty:
+            return
+
+        directory = os.path.dirname(self._path)
+        try:
+            fd, temp_path = tempfile.mkstemp(dir=directory,
+                                             prefix='.bundle-index')
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'version': INDEX_VERSION,
+                           'bundles': self._entries}, f)
+            os.rename(temp_path, self._path)
+        except (IOError, OSError), e:
+            logging.warning('Could not write the bundle index: %s', e)
+            return
+        self._dirty = False
+
+
+def get_index():
+    """Get the bundle index of the current profile."""
+    global _index
+
+    if _index is None:
+        _index = BundleIndex()
+        atexit.register(_index.save)
+    return _index
+
+
+def get_installed_bundles(translated=True):
+    """Get the activity bundles installed in the user and system
+    activity directories.
+
+    The metadata of the bundles comes from the index when it is up to
+    date, so only the bundles that changed since the last call have
+    their activity.info parsed.
+    """
+    from sugar3.bundle.activitybundle import ActivityBundle
+    from sugar3.bundle.bundle import MalformedBundleException
+
+    index = get_index()
+    bundles = []
+    found = set()
+    for activities_path in get_activities_paths():
+        try:
+            names = sorted(os.listdir(activities_path))
+        except OSError:
+            continue
+
+        for name in names:
+            # Skips the bundles being installed, see Bundle._unzip()
+            if name.startswith('.'):
+                continue
+            bundle_path = os.path.join(activities_path, name)
+            if not os.path.isdir(bundle_path):
+                continue
+            found.add(os.path.abspath(bundle_path))
+            try:
+                bundles.append(ActivityBundle(bundle_path,
+                                              translated=translated))
+            except MalformedBundleException, e:
+                logging.warning('Ignoring bundle %s: %s', bundle_path, e)
+
+    for bundle_path in index.get_bundle_paths():
+        if bundle_path not in found:
+            index.remove(bundle_path)
+    index.save()
+
+    return bundles
@@ -42,11 +42,20 @@ Invalid versions are:
 Based on the implementation of :pep:`386`, but adapted to our
 numeration schema.
 
+Parsed versions are interned, so constructing the same version again
+is cheap, and :func:`sort_versions` and :func:`max_version` order many
+versions at once.
+
 Attributes:
     VERSION_RE (RegexObject): regular expression for versions, deprecated, as it is insufficient by itself.
 """
 
 import re
+from collections import OrderedDict
+
+# Number of parsed versions kept by NormalizedVersion, the least recently
+# used are dropped first
+CACHE_SIZE = 4096
 
 
 VERSION_RE = re.compile(r'''
@@ -80,11 +89,34 @@ class NormalizedVersion(object):
         :exc:`InvalidVersionError`
 
     Attributes:
-        parts (list): the numeric parts of the version after normalization.
+        parts (tuple): the numeric parts of the version after
+            normalization.
     """
+
+    __slots__ = ('_activity_version', 'parts', '_local', '_key')
+
+    _instances = OrderedDict()
+
+    def __new__(cls, activity_version):
+        # Only str versions are valid, and u'1' == '1'
+        if isinstance(activity_version, str):
+            instance = cls._instances.pop((cls, activity_version), None)
+            if instance is not None:
+                cls._instances[cls, activity_version] = instance
+                return instance
+        return object.__new__(cls)
+
+    def __reduce__(self):
+        # Copies and unpickled versions are parsed, or interned, again
+        return (type(self), (self._activity_version,))
+
     def __init__(self, activity_version):
+        if hasattr(self, '_key'):
+            # Interned instance, already parsed
+            return
+
         self._activity_version = activity_version
-        self.parts = []
+        self.parts = ()
         self._local = None
 
         if not isinstance(self._activity_version, str):
@@ -96,14 +128,20 @@ class NormalizedVersion(object):
 
         groups = match.groupdict()
 
-        version = self._parse_version(groups['version'])
-        self.parts.append(version)
+        parts = [self._parse_version(groups['version'])]
 
         if groups['extraversion'] not in ('', None):
             versions = self._parse_extraversions(groups['extraversion'][1:])
-            self.parts.extend(versions)
+            parts.extend(versions)
 
+        # Shared by the holders of interned instances, so immutable
+        self.parts = tuple(parts)
         self._local = groups['local']
+        self._key = self.parts
+
+        if len(self._instances) >= CACHE_SIZE:
+            self._instances.popitem(last=False)
+        self._instances[type(self), activity_version] = self
 
     def _parse_version(self, version_string):
         """Verify that there is no leading zero and convert to integer.
@@ -160,12 +198,19 @@ class NormalizedVersion(object):
     def __eq__(self, other):
         if not isinstance(other, NormalizedVersion):
             self._cannot_compare(other)
-        return self.parts == other.parts
+        return self._key == other._key
 
     def __lt__(self, other):
         if not isinstance(other, NormalizedVersion):
             self._cannot_compare(other)
-        return self.parts < other.parts
+        return self._key < other._key
+
+    def __hash__(self):
+        return hash(self._key)
+
+    def get_sort_key(self):
+        """Get a key that orders like the versions, for :func:`sorted`."""
+        return self._key
 
     def __ne__(self, other):
         return not self.__eq__(other)
@@ -178,3 +223,33 @@ class NormalizedVersion(object):
 
     def __ge__(self, other):
         return self.__eq__(other) or self.__gt__(other)
+
+
+def _get_sort_key(version):
+    if not isinstance(version, NormalizedVersion):
+        version = NormalizedVersion(version)
+    return version._key
+
+
+def sort_versions(versions, reverse=False):
+    """Sort versions, given as strings or :class:`NormalizedVersion`.
+
+    Each version is parsed once, and the result holds the given objects.
+
+    Raises:
+        :exc:`InvalidVersionError`
+    """
+    return sorted(versions, key=_get_sort_key, reverse=reverse)
+
+
+def max_version(versions):
+    """Get the highest of versions, given as strings or
+    :class:`NormalizedVersion`, or None if there are none.
+
+    Raises:
+        :exc:`InvalidVersionError`
+    """
+    versions = list(versions)
+    if not versions:
+        return None
+    return max(versions, key=_get_sort_key)
@@ -58,9 +58,12 @@ class ContentBundle(Bundle):
         info_file = self.get_file('library/library.info')
         if info_file is None:
             raise MalformedBundleException('No library.info file')
-        self._parse_info(info_file)
+        try:
+            self._parse_info(info_file)
+        finally:
+            info_file.close()
 
-        if self.get_file(self._activity_start) is None:
+        if not self.is_file(self._activity_start):
             raise MalformedBundleException(
                 'Content bundle %s does not have start page %s' %
                 (self._path, self._activity_start))
@@ -133,13 +136,31 @@ class ContentBundle(Bundle):
         if self._zip_file is None:
             return os.path.join(self._path, icon_path)
         else:
-            icon_data = self.get_file(icon_path).read()
+            icon_data = self.get_icon_data()
             temp_file, temp_file_path = tempfile.mkstemp(prefix=self._icon,
                                                          suffix=ext)
             os.write(temp_file, icon_data)
             os.close(temp_file)
             return temp_file_path
 
+    def get_icon_data(self):
+        """Get the icon data, read straight from the bundle, so that a
+        zipped bundle does not need a temporary file."""
+        if not self._icon:
+            return None
+
+        icon_path = os.path.join('library', self._icon)
+        if os.path.splitext(icon_path)[1] == '':
+            icon_path += '.svg'
+
+        icon_file = self.get_file(icon_path)
+        if icon_file is None:
+            return None
+        try:
+            return icon_file.read()
+        finally:
+            icon_file.close()
+
     def get_start_uri(self):
         path = os.path.join(self.get_path(), self._activity_start)
         return 'file://' + urllib.pathname2url(path)
@@ -153,9 +174,9 @@ class ContentBundle(Bundle):
     def get_tags(self):
         return None
 
-    def install(self):
+    def install(self, progress_cb=None):
         install_path = env.get_user_library_path()
-        self._unzip(install_path)
+        self._unzip(install_path, progress_cb)
         return os.path.join(install_path, self._zip_root_dir)
 
     def uninstall(self, force=False, delete_profile=False):
@@ -1,4 +1,6 @@
+import heapq
 import weakref
+from collections import OrderedDict
 try:
     set
 except NameError:
@@ -19,7 +21,10 @@ class Signal(object):
     """Base class for all signals
 
     Internal attributes:
-        receivers -- { receriverkey (id) : weakref(receiver) }
+        receivers -- { lookup key : receiver or weakref(receiver) }
+        sender_receivers -- { sender key : { lookup key :
+            (connection index, receiver or weakref(receiver)) } },
+            in the order of connection
     """
 
     def __init__(self, providing_args=None):
@@ -27,7 +32,10 @@ class Signal(object):
                        this signal can pass along in
                        a send() call.
         """
-        self.receivers = []
+        self.receivers = {}
+        self.sender_receivers = {}
+        self._next_index = 0
+        self._dead_receivers = False
         if providing_args is None:
             providing_args = []
         self.providing_args = set(providing_args)
@@ -73,11 +81,15 @@ class Signal(object):
             receiver = saferef.safeRef(
                 receiver, onDelete=self._remove_receiver)
 
-        for r_key, _ in self.receivers:
-            if r_key == lookup_key:
-                break
-        else:
-            self.receivers.append((lookup_key, receiver))
+        self._clear_dead_receivers()
+        if lookup_key not in self.receivers:
+            self.receivers[lookup_key] = receiver
+            senderkey = lookup_key[1]
+            if senderkey not in self.sender_receivers:
+                self.sender_receivers[senderkey] = OrderedDict()
+            self.sender_receivers[senderkey][lookup_key] = \
+                (self._next_index, receiver)
+            self._next_index += 1
 
     def disconnect(self, receiver=None, sender=None, weak=True,
                    dispatch_uid=None):
@@ -102,9 +114,9 @@ class Signal(object):
         else:
             lookup_key = (_make_id(receiver), _make_id(sender))
 
-        for idx, (r_key, _) in enumerate(self.receivers):
-            if r_key == lookup_key:
-                del self.receivers[idx]
+        self._clear_dead_receivers()
+        if lookup_key in self.receivers:
+            self._remove_key(lookup_key)
 
     def send(self, sender, **named):
         """Send signal from sender to all connected receivers.
@@ -168,30 +180,48 @@ class Signal(object):
     def _live_receivers(self, senderkey):
         """Filter sequence of receivers to get resolved, live receivers
 
-        This checks for weak references
-        and resolves them, then returning only live
+        Only the receivers connected to this sender and to any sender
+        are looked at, in the order of connection.  This checks for
+        weak references and resolves them, then returning only live
         receivers.
         """
+        self._clear_dead_receivers()
         none_senderkey = _make_id(None)
 
-        for (receiverkey, r_senderkey), receiver in self.receivers:
-            if r_senderkey == none_senderkey or r_senderkey == senderkey:
-                if isinstance(receiver, WEAKREF_TYPES):
-                    # Dereference the weak reference.
-                    receiver = receiver()
-                    if receiver is not None:
-                        yield receiver
-                else:
+        buckets = [self.sender_receivers.get(none_senderkey)]
+        if senderkey != none_senderkey:
+            buckets.append(self.sender_receivers.get(senderkey))
+        entries = list(heapq.merge(*[bucket.values() for bucket in buckets
+                                     if bucket]))
+
+        for index_, receiver in entries:
+            if isinstance(receiver, WEAKREF_TYPES):
+                # Dereference the weak reference.
+                receiver = receiver()
+                if receiver is not None:
                     yield receiver
+            else:
+                yield receiver
+
+    def _remove_key(self, lookup_key):
+        del self.receivers[lookup_key]
+        senderkey = lookup_key[1]
+        bucket = self.sender_receivers[senderkey]
+        del bucket[lookup_key]
+        if not bucket:
+            del self.sender_receivers[senderkey]
 
     def _remove_receiver(self, receiver):
+        """Mark that a weakly referenced receiver died, it is removed
+        from connections on the next call of the signal."""
+        self._dead_receivers = True
+
+    def _clear_dead_receivers(self):
         """Remove dead receivers from connections."""
+        if not self._dead_receivers:
+            return
+        self._dead_receivers = False
 
-        to_remove = []
-        for key, connected_receiver in self.receivers:
-            if connected_receiver == receiver:
-                to_remove.append(key)
-        for key in to_remove:
-            for idx, (r_key, _) in enumerate(self.receivers):
-                if r_key == key:
-                    del self.receivers[idx]
+        for lookup_key, receiver in self.receivers.items():
+            if isinstance(receiver, WEAKREF_TYPES) and receiver() is None:
+                self._remove_key(lookup_key)
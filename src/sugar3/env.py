@@ -62,3 +62,9 @@ def get_user_activities_path():
 def get_user_library_path():
     return os.environ.get("SUGAR_LIBRARY_PATH",
                           os.path.expanduser('~/Library'))
+
+
+def get_zygote_socket_path():
+    """Get the path of the socket on which `sugar-activity --zygote`
+    accepts activity launch requests."""
+    return get_profile_path('activity-zygote.socket')
@@ -116,8 +116,10 @@ class _SVGLoader(object):
     def __init__(self):
         self._cache = LRU(100)
 
-    def load(self, file_name, entities, cache):
-        if file_name in self._cache:
+    def load(self, file_name, entities, cache, data=None):
+        if data is not None:
+            icon = data
+        elif file_name in self._cache:
             icon = self._cache[file_name]
         else:
             icon_file = open(file_name, 'r')
@@ -164,6 +166,7 @@ class _IconBuffer(object):
         self.icon_name = None
         self.icon_size = None
         self.file_name = None
+        self.icon_data = None
         self.fill_color = None
         self.background_color = None
         self.stroke_color = None
@@ -181,18 +184,18 @@ class _IconBuffer(object):
             color = (self.background_color.red, self.background_color.green,
                      self.background_color.blue)
 
-        return (self.icon_name, self.file_name, self.pixbuf, self.fill_color,
-                self.stroke_color, self.badge_name, self.width, self.height,
-                color, sensitive)
+        return (self.icon_name, self.file_name, self.icon_data, self.pixbuf,
+                self.fill_color, self.stroke_color, self.badge_name,
+                self.width, self.height, color, sensitive)
 
-    def _load_svg(self, file_name):
+    def _load_svg(self, file_name, data=None):
         entities = {}
         if self.fill_color:
             entities['fill_color'] = self.fill_color
         if self.stroke_color:
             entities['stroke_color'] = self.stroke_color
 
-        return self._loader.load(file_name, entities, self.cache)
+        return self._loader.load(file_name, entities, self.cache, data)
 
     def _get_attach_points(self, info, size_request):
         has_attach_points_, attach_points = info.get_attach_points()
@@ -351,12 +354,26 @@ class _IconBuffer(object):
             icon_info = self._get_icon_info(self.file_name, self.icon_name)
             is_svg = False
         else:
+            icon_width = None
+            if self.icon_data is not None:
+                # SVG data given in memory, for example from a zipped bundle
+                icon_info = _IconInfo()
+                is_svg = True
+                try:
+                    handle = self._load_svg(None, self.icon_data)
+                    icon_width = handle.props.width
+                    icon_height = handle.props.height
+                except GLib.GError:
+                    logging.warning('Invalid icon data')
+
             # We run two attempts at finding the icon. First, we try the icon
             # requested by the user. If that fails, we fall back on
             # document-generic. If that doesn't work out, bail.
-            icon_width = None
             for (file_name, icon_name) in ((self.file_name, self.icon_name),
                                            (None, 'document-generic')):
+                if icon_width is not None:
+                    break
+
                 icon_info = self._get_icon_info(file_name, icon_name)
                 if icon_info.file_name is None:
                     return None
@@ -450,6 +467,7 @@ class Icon(Gtk.Image):
         file_name (str): a path to the SVG icon file
         file (object): same behaviour as file_name, but for
             :class:`sugar3.util.TempFilePath` type objects
+        icon_data (str): SVG icon data, see :any:`set_icon_data`
         icon_name (str): a name of an icon in the theme to display.  The
             icons in the theme include those in the sugar-artwork project
             and icons in the activity's '/icons' directory
@@ -498,6 +516,27 @@ class Icon(Gtk.Image):
 
     file = GObject.Property(type=object, setter=set_file, getter=get_file)
 
+    def get_icon_data(self):
+        return self._buffer.icon_data
+
+    def set_icon_data(self, icon_data):
+        '''
+        Set the SVG data of the icon, to display an icon that is not in a
+        file, like :any:`ActivityBundle.get_icon_data` for a zipped bundle.
+        It takes precedence over `file` and `icon_name`.
+
+        Args:
+            icon_data (str): SVG document
+        '''
+        self._buffer.icon_data = icon_data
+        self.queue_resize()
+
+    icon_data = GObject.Property(type=object, setter=set_icon_data,
+                                 getter=get_icon_data)
+    '''
+    icon.props.icon_data -> see :any:`get_icon_data` and :any:`set_icon_data`
+    '''
+
     def get_pixbuf(self):
         '''
         Returns the :class:`GdkPixbuf.Pixbuf` for the icon, if one has been
@@ -773,8 +812,8 @@ class EventIcon(Gtk.EventBox):
 
     Otherwise, the icon setup api is the same as the basic :class:`Icon`.
     This EventIcon class supports the icon_name, stroke_color, fill_color,
-    file_name, xo_color, pixel_size, scale and alpha keyword arguments as
-    the :class:`Icon`.  The added arguments are as follows:
+    file_name, icon_data, xo_color, pixel_size, scale and alpha keyword
+    arguments as the :class:`Icon`.  The added arguments are as follows:
 
     Keyword Args:
         background_color (Gdk.Color): the color to draw the icon on top of.
@@ -865,6 +904,17 @@ class EventIcon(Gtk.EventBox):
     file_name = GObject.Property(
         type=object, getter=get_file_name, setter=set_file_name)
 
+    def set_icon_data(self, value):
+        if self._buffer.icon_data != value:
+            self._buffer.icon_data = value
+            self.queue_draw()
+
+    def get_icon_data(self):
+        return self._buffer.icon_data
+
+    icon_data = GObject.Property(
+        type=object, getter=get_icon_data, setter=set_icon_data)
+
     def set_icon_name(self, value):
         if self._buffer.icon_name != value:
             self._buffer.icon_name = value
@@ -21,27 +21,286 @@ UNSTABLE.
 from __future__ import absolute_import
 
 import argparse
+import json
+import logging
+import multiprocessing
 import sys
 import os
+import subprocess
 import tempfile
 import shutil
+import time
+import traceback
 import unittest
+from distutils.spawn import find_executable
+from StringIO import StringIO
+
+SLOWEST_TESTS = 10
+
+_COUNTS = ['tests_run', 'failures', 'errors', 'skipped',
+           'expected_failures', 'unexpected_successes']
+
+
+class _TimingResult(unittest.TextTestResult):
+    """A text test result which also records the duration of each
+    test."""
+
+    def __init__(self, *args, **kwargs):
+        super(_TimingResult, self).__init__(*args, **kwargs)
+        self.timings = []
+        self._start_time = None
+
+    def startTest(self, test):
+        self._start_time = time.time()
+        super(_TimingResult, self).startTest(test)
+
+    def stopTest(self, test):
+        super(_TimingResult, self).stopTest(test)
+        self.timings.append((test.id(), time.time() - self._start_time))
+
+
+def _iter_tests(suite):
+    for test in suite:
+        if isinstance(test, unittest.TestSuite):
+            for child in _iter_tests(test):
+                yield child
+        else:
+            yield test
+
+
+def _get_module_name(test):
+    # The loader replaces the modules it fails to import by a test
+    # named after them
+    module = type(test).__module__
+    if module == 'unittest.loader':
+        return test._testMethodName
+    return module
+
+
+def _get_import_failure(name, message):
+    def test_import(self):
+        raise ImportError(message)
+
+    test_class = type('ModuleImportFailure', (unittest.TestCase,),
+                      {name: test_import})
+    return test_class(name)
+
+
+def _get_shards(suite, jobs):
+    # The modules with the most tests go first, each one to the shard
+    # with the fewest tests so far
+    counts = {}
+    for test in _iter_tests(suite):
+        module = _get_module_name(test)
+        counts[module] = counts.get(module, 0) + 1
+
+    shards = [[] for i_ in range(jobs)]
+    sizes = [0] * jobs
+    for module in sorted(counts, key=lambda module: (-counts[module],
+                                                     module)):
+        index = sizes.index(min(sizes))
+        shards[index].append(module)
+        sizes[index] += counts[module]
+    return [shard for shard in shards if shard]
+
+
+def _run_suite(suite, stream, verbosity):
+    # pylint: disable=W0212
+    result = _TimingResult(unittest.runner._WritelnDecorator(stream),
+                           True, verbosity)
+    suite(result)
+    result.printErrors()
+    return {'tests_run': result.testsRun,
+            'failures': len(result.failures),
+            'errors': len(result.errors),
+            'skipped': len(result.skipped),
+            'expected_failures': len(result.expectedFailures),
+            'unexpected_successes': len(result.unexpectedSuccesses),
+            'timings': result.timings}
+
+
+def _get_worker_failure(message):
+    result = dict((key, 0) for key in _COUNTS)
+    result['errors'] = 1
+    result['timings'] = []
+    result['output'] = message
+    return result
+
+
+def _run_shards(tests_dir, shards, verbosity, dbus, paths):
+    if dbus and find_executable('dbus-run-session') is None:
+        logging.warning('dbus-run-session is not installed, the workers '
+                        'share the D-Bus session bus')
+        dbus = False
+
+    # The workers must find sugar3 and the modules tested
+    python_path = list(paths or [])
+    sugar_path = os.path.dirname(os.path.abspath(__file__))
+    python_path.append(os.path.dirname(os.path.dirname(sugar_path)))
+    if 'PYTHONPATH' in os.environ:
+        python_path.append(os.environ['PYTHONPATH'])
+
+    temp_dir = tempfile.mkdtemp()
+    try:
+        workers = []
+        for shard in shards:
+            worker_dir = tempfile.mkdtemp(dir=temp_dir)
+            results_path = os.path.join(worker_dir, 'results.json')
+
+            env = dict(os.environ)
+            env['TMPDIR'] = worker_dir
+            env['PYTHONPATH'] = os.pathsep.join(python_path)
+
+            args = [sys.executable, '-m', 'sugar3.test.discover',
+                    '--verbosity', str(verbosity),
+                    '--results', results_path, tests_dir] + shard
+            if dbus:
+                args = ['dbus-run-session', '--'] + args
+
+            workers.append((subprocess.Popen(args, env=env), results_path))
+
+        results = []
+        for process, results_path in workers:
+            returncode = process.wait()
+            try:
+                with open(results_path) as f:
+                    result = json.load(f)
+            except (IOError, ValueError):
+                result = _get_worker_failure(
+                    'Test worker exited with code %d\n' % returncode)
+
+            sys.stderr.write(result['output'].encode('utf-8'))
+            results.append(result)
+        return results
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def _print_summary(results, duration, stream):
+    totals = dict((key, sum(result[key] for result in results))
+                  for key in _COUNTS)
+
+    timings = []
+    for result in results:
+        timings.extend(result['timings'])
+    timings.sort(key=lambda timing: timing[1], reverse=True)
+    if timings:
+        stream.write('Slowest tests:\n')
+        for test_id, seconds in timings[:SLOWEST_TESTS]:
+            stream.write('%8.3fs %s\n' % (seconds, test_id))
+
+    stream.write('-' * 70 + '\n')
+    run = totals['tests_run']
+    stream.write('Ran %d test%s in %.3fs\n\n' %
+                 (run, run != 1 and 's' or '', duration))
+
+    infos = []
+    successful = not totals['failures'] and not totals['errors']
+    if successful:
+        stream.write('OK')
+    else:
+        stream.write('FAILED')
+        if totals['failures']:
+            infos.append('failures=%d' % totals['failures'])
+        if totals['errors']:
+            infos.append('errors=%d' % totals['errors'])
+    if totals['skipped']:
+        infos.append('skipped=%d' % totals['skipped'])
+    if totals['expected_failures']:
+        infos.append('expected failures=%d' % totals['expected_failures'])
+    if totals['unexpected_successes']:
+        infos.append('unexpected successes=%d' %
+                     totals['unexpected_successes'])
+    if infos:
+        stream.write(' (%s)' % ', '.join(infos))
+    stream.write('\n')
+
+    return successful
+
+
+def run_tests(tests_dir, jobs=1, verbosity=1, dbus=False, paths=None):
+    """Run the tests found in a directory, and report the slowest ones.
+
+    With more than one job, the test modules are split over as many
+    worker processes, each one with its own TMPDIR and, if dbus is
+    True, its own D-Bus session bus.
+
+    Args:
+        tests_dir (str): the base tests directory
+        jobs (int): the number of worker processes
+        verbosity (int): the unittest verbosity
+        dbus (bool): whether to start a session bus for each worker
+        paths (list): directories the workers need in their python path
+
+    Returns:
+        bool: whether all the tests passed
+    """
+    start_time = time.time()
+    tests_dir = os.path.abspath(tests_dir)
+    verbosity = verbosity or 0
+
+    suite = unittest.defaultTestLoader.discover(tests_dir)
+    shards = []
+    if jobs > 1:
+        shards = _get_shards(suite, jobs)
+
+    if len(shards) > 1:
+        results = _run_shards(tests_dir, shards, verbosity, dbus, paths)
+    else:
+        results = [_run_suite(suite, sys.stderr, verbosity)]
+
+    return _print_summary(results, time.time() - start_time, sys.stderr)
+
+
+def _run_worker(args):
+    tests_dir = os.path.abspath(args.tests_dir)
+    sys.path.insert(0, tests_dir)
+
+    suite = unittest.TestSuite()
+    for name in args.modules:
+        try:
+            suite.addTest(unittest.defaultTestLoader.loadTestsFromName(name))
+        except Exception:
+            # pylint: disable=W0703
+            suite.addTest(_get_import_failure(name, traceback.format_exc()))
+
+    stream = StringIO()
+    result = _run_suite(suite, stream, args.verbosity)
+    output = stream.getvalue()
+    if not isinstance(output, unicode):
+        output = output.decode('utf-8', 'replace')
+    result['output'] = output
+
+    with open(args.results, 'w') as f:
+        json.dump(result, f)
 
 
 def main():
     parser = argparse.ArgumentParser(description="Discover unit tests.")
     parser.add_argument("tests_dir", help="Base tests directory")
+    parser.add_argument("--jobs", "-j", type=int, nargs='?', default=1,
+                        const=multiprocessing.cpu_count(),
+                        help="Number of processes running the test modules, "
+                             "the number of CPUs if not given")
+    parser.add_argument("--dbus", action="store_true", default=False,
+                        help="Start a D-Bus session bus for each process")
+    parser.add_argument("--verbosity", type=int, default=1,
+                        help="Verbosity of the test output")
+    parser.add_argument("--results", help=argparse.SUPPRESS)
+    parser.add_argument("modules", nargs='*', help=argparse.SUPPRESS)
     args = parser.parse_args()
 
+    if args.results is not None:
+        _run_worker(args)
+        return
+
     temp_dir = tempfile.mkdtemp()
 
     os.chdir(args.tests_dir)
     os.environ["TMPDIR"] = temp_dir
 
     try:
-        test = unittest.defaultTestLoader.discover(".")
-        result = unittest.TextTestRunner().run(test)
-        if not result.wasSuccessful():
+        if not run_tests(".", args.jobs, args.verbosity, args.dbus):
             sys.exit(1)
     finally:
         shutil.rmtree(temp_dir)
@@ -27,44 +27,236 @@ from gi.repository import Atspi
 from gi.repository import GLib
 
 
+# Seconds a find waits for the expected result
+TIMEOUT = 50
+
+# Seconds between the tries, when no event wakes them up earlier
+MIN_DELAY = 0.01
+MAX_DELAY = 1
+
+EVENT_TYPES = ['object:children-changed', 'object:state-changed',
+               'object:property-change:accessible-name',
+               'object:property-change:accessible-role']
+
+_tree_cache = None
+
+
 def get_root():
     return Node(Atspi.get_desktop(0))
 
 
+class _TreeCache(object):
+    """The children, names and roles of the accessibles, and the
+    snapshots of their subtrees, kept until the AT-SPI events tell they
+    changed."""
+
+    def __init__(self):
+        self.serial = 0
+        self._children = {}
+        self._infos = {}
+        self._snapshots = {}
+
+        self._listener = Atspi.EventListener.new(self.__event_cb)
+        for event_type in EVENT_TYPES:
+            self._listener.register(event_type)
+
+    def __event_cb(self, event):
+        if event.type.startswith('object:children-changed') or \
+                event.type == 'object:state-changed:defunct':
+            self._children.pop(event.source, None)
+            self._snapshots.clear()
+        elif event.type.startswith('object:property-change'):
+            self._infos.pop(event.source, None)
+        self.serial += 1
+
+    def get_children(self, accessible):
+        children = self._children.get(accessible)
+        if children is None:
+            children = []
+            for i in range(accessible.get_child_count()):
+                child = accessible.get_child_at_index(i)
+
+                # We sometimes get none children from atspi
+                if child is not None:
+                    children.append(child)
+            self._children[accessible] = children
+        return children
+
+    def get_info(self, accessible):
+        """Get the name and role name of an accessible."""
+        info = self._infos.get(accessible)
+        if info is None:
+            info = (accessible.get_name(), accessible.get_role_name())
+            self._infos[accessible] = info
+        return info
+
+    def get_snapshot(self, accessible):
+        snapshot = self._snapshots.get(accessible)
+        if snapshot is None:
+            snapshot = Snapshot(self, accessible)
+            self._snapshots[accessible] = snapshot
+        return snapshot
+
+    def clear(self):
+        self._children.clear()
+        self._infos.clear()
+        self._snapshots.clear()
+
+    def dispatch_pending(self):
+        """Dispatch the AT-SPI events already received."""
+        context = GLib.MainContext.default()
+        while context.pending():
+            context.iteration(False)
+
+    def wait(self, serial, timeout):
+        """Dispatch the AT-SPI events until one comes after serial, or
+        for timeout seconds.
+
+        Returns:
+            bool: whether an event came
+        """
+        timed_out = []
+
+        def timeout_cb():
+            timed_out.append(True)
+            return False
+
+        source_id = GLib.timeout_add(int(timeout * 1000), timeout_cb)
+        context = GLib.MainContext.default()
+        while self.serial == serial and not timed_out:
+            context.iteration(True)
+        if not timed_out:
+            GLib.source_remove(source_id)
+
+        return self.serial != serial
+
+
+def _get_matches(accessible):
+    # All the descendants in a single call, if the application
+    # implements the collection interface
+    # New, incompatible API
+    if hasattr(accessible, "get_collection_iface"):
+        collection = accessible.get_collection_iface()
+    else:
+        collection = accessible.get_collection()
+    if collection is None:
+        return None
+
+    match_all = Atspi.CollectionMatchType.ALL
+    rule = Atspi.MatchRule.new(Atspi.StateSet.new([]), match_all,
+                               {}, match_all, [], match_all, [], match_all,
+                               False)
+    try:
+        matches = collection.get_matches(
+            rule, Atspi.CollectionSortOrder.CANONICAL, 0, True)
+    except GLib.GError:
+        return None
+    return [match for match in matches if match is not None]
+
+
+def _get_tree_cache():
+    global _tree_cache
+
+    if _tree_cache is None:
+        _tree_cache = _TreeCache()
+    return _tree_cache
+
+
+def _get_updated_tree_cache():
+    # The events received since the last find may have changed the tree
+    tree_cache = _get_tree_cache()
+    tree_cache.dispatch_pending()
+    return tree_cache
+
+
 def _retry_find(func):
     def wrapped(*args, **kwargs):
-        result = None
-        n_retries = 1
+        tree_cache = _get_tree_cache()
+        expect_none = kwargs.get("expect_none", False)
+        deadline = time.time() + TIMEOUT
+        delay = MIN_DELAY
+        n_tries = 1
 
-        while n_retries <= 50:
+        while True:
             logging.info("Try %d, name=%s role_name=%s" %
-                         (n_retries,
+                         (n_tries,
                           kwargs.get("name", None),
                           kwargs.get("role_name", None)))
 
+            tree_cache.dispatch_pending()
+            serial = tree_cache.serial
+            result = None
             try:
                 result = func(*args, **kwargs)
             except GLib.GError, e:
                 # The application is not responding, try again
-                if e.code == Atspi.Error.IPC:
-                    continue
-
-                logging.error("GError code %d" % e.code)
-                raise
+                if e.code != Atspi.Error.IPC:
+                    logging.error("GError code %d" % e.code)
+                    raise
+            else:
+                if (not expect_none and result) or \
+                   (expect_none and not result):
+                    return result
 
-            expect_none = kwargs.get("expect_none", False)
-            if (not expect_none and result) or \
-               (expect_none and not result):
+            remaining = deadline - time.time()
+            if remaining <= 0:
                 return result
 
-            time.sleep(1)
-            n_retries = n_retries + 1
-
-        return result
+            # Try again as soon as the tree changes.  Without any event,
+            # the whole tree is crawled again after the delay, in case
+            # the application does not emit them.
+            if not tree_cache.wait(serial, min(delay, remaining)):
+                tree_cache.clear()
+            delay = min(delay * 2, MAX_DELAY)
+            n_tries = n_tries + 1
 
     return wrapped
 
 
+class Snapshot(object):
+    """The descendants of an accessible, read in bulk.
+
+    The names and roles of the accessibles are read once, and the
+    finds are answered from the snapshot until the AT-SPI events tell
+    that the tree changed.
+    """
+
+    def __init__(self, tree_cache, accessible):
+        self._tree_cache = tree_cache
+        self.accessibles = [accessible]
+        self._read_descendants(accessible)
+
+    def _read_descendants(self, accessible):
+        matches = _get_matches(accessible)
+        if matches is not None:
+            self.accessibles.extend(matches)
+            return
+
+        for child in self._tree_cache.get_children(accessible):
+            self.accessibles.append(child)
+            self._read_descendants(child)
+
+    def _matches(self, accessible, name, role_name):
+        node_name, node_role_name = self._tree_cache.get_info(accessible)
+        if name is not None and name != node_name:
+            return False
+
+        if role_name is not None and role_name != node_role_name:
+            return False
+
+        return True
+
+    def find_children(self, name=None, role_name=None):
+        return [Node(accessible) for accessible in self.accessibles
+                if self._matches(accessible, name, role_name)]
+
+    def find_child(self, name=None, role_name=None):
+        for accessible in self.accessibles:
+            if self._matches(accessible, name, role_name):
+                return Node(accessible)
+        return None
+
+
 class Node:
     def __init__(self, accessible):
         self._accessible = accessible
@@ -91,81 +283,37 @@ class Node:
 
     @property
     def name(self):
-        return self._accessible.get_name()
+        return _get_updated_tree_cache().get_info(self._accessible)[0]
 
     @property
     def role_name(self):
-        return self._accessible.get_role_name()
+        return _get_updated_tree_cache().get_info(self._accessible)[1]
 
     @property
     def text(self):
         return Atspi.Text.get_text(self._accessible, 0, -1)
 
     def get_children(self):
-        children = []
+        return [Node(child) for child in
+                _get_updated_tree_cache().get_children(self._accessible)]
 
-        for i in range(self._accessible.get_child_count()):
-            child = self._accessible.get_child_at_index(i)
-
-            # We sometimes get none children from atspi
-            if child is not None:
-                children.append(Node(child))
-
-        return children
+    def get_snapshot(self):
+        """Get the snapshot of the subtree of this node.  The same one
+        is returned until the tree changes, a snapshot is never
+        updated."""
+        return _get_updated_tree_cache().get_snapshot(self._accessible)
 
     @_retry_find
     def find_children(self, name=None, role_name=None):
-        def predicate(node):
-            return self._predicate(node, name, role_name)
-
-        descendants = []
-        self._find_all_descendants(self, predicate, descendants)
-        if not descendants:
-            return []
-
-        return descendants
+        return self.get_snapshot().find_children(name, role_name)
 
     @_retry_find
     def find_child(self, name=None, role_name=None, expect_none=False):
-        def predicate(node):
-            return self._predicate(node, name, role_name)
-
-        node = self._find_descendant(self, predicate)
-        if node is None:
-            return None
-
-        return node
+        return self.get_snapshot().find_child(name, role_name)
 
     def __str__(self):
         return "[%s | %s]" % (self.name, self.role_name)
 
-    def _predicate(self, node, name, role_name):
-        if name is not None and name != node.name:
-            return False
-
-        if role_name is not None and role_name != node.role_name:
-            return False
-
-        return True
-
-    def _find_descendant(self, node, predicate):
-        if predicate(node):
-            return node
-
-        for child in node.get_children():
-            descendant = self._find_descendant(child, predicate)
-            if descendant is not None:
-                return descendant
-
-        return None
-
-    def _find_all_descendants(self, node, predicate, matches):
-        if predicate(node):
-            matches.append(node)
-
-        for child in node.get_children():
-            self._find_all_descendants(child, predicate, matches)
-
     def _crawl_accessible(self, node, depth, lines):
         lines.append("  " * depth + str(node))
 
@@ -0,0 +1,192 @@
+# Copyright (C) 2016 Sugar Labs
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+"""Startup timeline tracing.
+
+When the SUGAR_TRACE_STARTUP environment variable is set, checkpoints
+recorded with this module during an activity launch are written to
+`<bundle_id>-<pid>.trace.json` in the logs directory.  The file uses
+the Chrome trace event format, so it can be loaded in chrome://tracing.
+
+Timestamps come from the system monotonic clock, so checkpoints
+recorded by the shell and by the activity process line up.
+
+UNSTABLE.
+"""
+
+import atexit
+import json
+import logging
+import os
+import time
+
+from sugar3 import env
+
+TRACE_VARIABLE = 'SUGAR_TRACE_STARTUP'
+LAUNCH_VARIABLE = 'SUGAR_TRACE_LAUNCH'
+
+_CLOCK_MONOTONIC = 1
+
+_enabled = bool(os.environ.get(TRACE_VARIABLE))
+_events = []
+_written_events = 0
+_clock_gettime = None
+
+
+def _get_clock_gettime():
+    global _clock_gettime
+
+    if _clock_gettime is None:
+        try:
+            import ctypes
+
+            class Timespec(ctypes.Structure):
+                _fields_ = [('tv_sec', ctypes.c_long),
+                            ('tv_nsec', ctypes.c_long)]
+
+            libc = ctypes.CDLL('libc.so.6')
+            timespec = Timespec()
+
+            def clock_gettime():
+                if libc.clock_gettime(_CLOCK_MONOTONIC,
+                                      ctypes.byref(timespec)) != 0:
+                    return time.time()
+                return timespec.tv_sec + timespec.tv_nsec * 1e-9
+
+            clock_gettime()
+            _clock_gettime = clock_gettime
+        except Exception:
+            # pylint: disable=W0703
+            _clock_gettime = time.time
+
+    return _clock_gettime
+
+
+def now():
+    """Get a monotonic timestamp in seconds, comparable between
+    processes."""
+    return _get_clock_gettime()()
+
+
+def is_enabled():
+    """Get whether startup tracing is enabled for this process."""
+    return _enabled
+
+
+def _add_event(name, phase, timestamp, pid=None, **kwargs):
+    event = {'name': name,
+             'ph': phase,
+             'ts': int(timestamp * 1000000),
+             'pid': pid or os.getpid(),
+             'tid': 0}
+    event.update(kwargs)
+    _events.append(event)
+
+
+def instant(name, timestamp=None, **args):
+    """Record a checkpoint."""
+    if _enabled:
+        if timestamp is None:
+            timestamp = now()
+        _add_event(name, 'i', timestamp, s='p', args=args)
+
+
+def begin(name, **args):
+    """Record the start of a phase, ended by :func:`end`."""
+    if _enabled:
+        _add_event(name, 'B', now(), args=args)
+
+
+def end(name, **args):
+    """Record the end of a phase started by :func:`begin`."""
+    if _enabled:
+        _add_event(name, 'E', now(), args=args)
+
+
+def complete(name, start, finish=None, **args):
+    """Record a phase from its start and finish timestamps."""
+    if _enabled:
+        if finish is None:
+            finish = now()
+        _add_event(name, 'X', start,
+                   dur=int((finish - start) * 1000000), args=args)
+
+
+def set_launch_environment(environ):
+    """Record the launch of an activity by the shell in the environment
+    of the activity process, which adds it to its own trace."""
+    if _enabled:
+        environ[LAUNCH_VARIABLE] = '%d %r' % (os.getpid(), now())
+
+
+def _add_launch_event():
+    value = os.environ.pop(LAUNCH_VARIABLE, None)
+    if value is None:
+        return
+
+    try:
+        pid, timestamp = value.split()
+        _add_event('launch', 'i', float(timestamp), pid=int(pid), s='g')
+    except ValueError:
+        logging.warning('Invalid %s value %r' % (LAUNCH_VARIABLE, value))
+
+
+def write(path=None):
+    """Write the recorded events, if tracing is enabled.
+
+    Returns:
+        str: the path of the trace file, or None if nothing was written
+    """
+    global _written_events
+
+    if not _enabled or len(_events) == _written_events:
+        return None
+
+    if path is None:
+        name = os.environ.get('SUGAR_BUNDLE_ID', 'sugar')
+        path = env.get_logs_path('%s-%d.trace.json' % (name, os.getpid()))
+
+    try:
+        directory = os.path.dirname(path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': _events, 'displayTimeUnit': 'ms'}, f,
+                      separators=(',', ':'))
+    except (IOError, OSError), e:
+        logging.warning('Could not write the startup trace: %s' % e)
+        return None
+
+    _written_events = len(_events)
+    return path
+
+
+def restart():
+    """Start a new trace from the current environment, as needed in a
+    process forked from another one."""
+    global _enabled, _events, _written_events
+
+    _enabled = bool(os.environ.get(TRACE_VARIABLE))
+    _events = []
+    _written_events = 0
+    if _enabled:
+        _add_launch_event()
+
+
+if _enabled:
+    _add_launch_event()
+atexit.register(write)
@@ -14,19 +14,50 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
 
+import copy
 import os
+import pickle
+import shutil
+import tempfile
 import unittest
 import subprocess
 
 from sugar3.bundle.helpers import bundle_from_dir, bundle_from_archive
 from sugar3.bundle.activitybundle import ActivityBundle
 from sugar3.bundle.contentbundle import ContentBundle
+from sugar3.bundle.bundleindex import BundleIndex, is_indexed
+from sugar3.bundle.bundleversion import NormalizedVersion, \
+    sort_versions, max_version
 
 tests_dir = os.path.dirname(__file__)
 data_dir = os.path.join(tests_dir, "data")
 SAMPLE_ACTIVITY_PATH = os.path.join(data_dir, 'sample.activity')
 SAMPLE_CONTENT_PATH = os.path.join(data_dir, 'sample.content')
 
+_environ = {}
+_temp_home = None
+
+
+def setUpModule():
+    # Keep the bundle index and the installed activities out of the
+    # real profile
+    global _temp_home
+
+    _temp_home = tempfile.mkdtemp()
+    for name, path in [('SUGAR_HOME', 'sugar'),
+                       ('SUGAR_ACTIVITIES_PATH', 'Activities')]:
+        _environ[name] = os.environ.get(name)
+        os.environ[name] = os.path.join(_temp_home, path)
+
+
+def tearDownModule():
+    for name, value in _environ.items():
+        if value is None:
+            del os.environ[name]
+        else:
+            os.environ[name] = value
+    shutil.rmtree(_temp_home)
+
 
 class TestBundle(unittest.TestCase):
     def test_bundle_from_dir(self):
@@ -47,3 +78,83 @@ class TestBundle(unittest.TestCase):
         subprocess.check_call(["zip", "-r", "sample-1.xol", "sample.content"])
         bundle = bundle_from_archive("./sample-1.xol")
         self.assertIsInstance(bundle, ContentBundle)
+
+
+class TestBundleIndex(unittest.TestCase):
+    def setUp(self):
+        self._temp_dir = tempfile.mkdtemp()
+        self._index_path = os.path.join(self._temp_dir, 'bundle-index.json')
+
+    def tearDown(self):
+        shutil.rmtree(self._temp_dir)
+
+    def test_store_and_lookup(self):
+        index = BundleIndex(self._index_path)
+        index.store(SAMPLE_ACTIVITY_PATH, None, {'_name': 'Sample'})
+        index.save()
+
+        index = BundleIndex(self._index_path)
+        self.assertEqual(index.lookup(SAMPLE_ACTIVITY_PATH, None),
+                         {'_name': 'Sample'})
+        self.assertIsNone(index.lookup(SAMPLE_ACTIVITY_PATH, 'fr_FR'))
+
+    def test_outdated_entry(self):
+        bundle_path = os.path.join(self._temp_dir, 'sample.activity')
+        # Without what the packaging tests build in the sample activity
+        shutil.copytree(SAMPLE_ACTIVITY_PATH, bundle_path,
+                        ignore=shutil.ignore_patterns('locale', 'dist'))
+
+        index = BundleIndex(self._index_path)
+        index.store(bundle_path, None, {'_name': 'Sample'})
+
+        info_path = os.path.join(bundle_path, 'activity', 'activity.info')
+        with open(info_path, 'a') as f:
+            f.write('summary = Changed\n')
+        self.assertIsNone(index.lookup(bundle_path, None))
+
+    def test_outdated_translation(self):
+        bundle_path = os.path.join(self._temp_dir, 'sample.activity')
+        # Without what the packaging tests build in the sample activity
+        shutil.copytree(SAMPLE_ACTIVITY_PATH, bundle_path,
+                        ignore=shutil.ignore_patterns('locale', 'dist'))
+        linfo_dir = os.path.join(bundle_path, 'locale', 'es')
+        os.makedirs(linfo_dir)
+        linfo_path = os.path.join(linfo_dir, 'activity.linfo')
+        with open(linfo_path, 'w') as f:
+            f.write('[Activity]\nname = Ejemplo\n')
+
+        index = BundleIndex(self._index_path)
+        index.store(bundle_path, 'es', {'_name': 'Ejemplo'},
+                    'locale/es/activity.linfo')
+        self.assertIsNotNone(index.lookup(bundle_path, 'es'))
+
+        with open(linfo_path, 'a') as f:
+            f.write('summary = Un ejemplo\n')
+        self.assertIsNone(index.lookup(bundle_path, 'es'))
+
+    def test_is_indexed(self):
+        self.assertFalse(is_indexed(SAMPLE_ACTIVITY_PATH))
+        self.assertTrue(is_indexed(
+            os.path.join(os.environ['SUGAR_ACTIVITIES_PATH'],
+                         'Sample.activity')))
+
+
+class TestBundleVersion(unittest.TestCase):
+    def test_interned(self):
+        self.assertIs(NormalizedVersion('1.2'), NormalizedVersion('1.2'))
+        self.assertEqual(NormalizedVersion('1.2'), NormalizedVersion('1.2.0'))
+        self.assertEqual(NormalizedVersion('1.2').parts, (1, 2))
+
+    def test_copy(self):
+        version = NormalizedVersion('1.2~beta')
+        self.assertIs(copy.copy(version), version)
+        for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+            copied = pickle.loads(pickle.dumps(version, protocol))
+            self.assertEqual(copied, version)
+            self.assertEqual(str(copied), '1.2~beta')
+
+    def test_sort_versions(self):
+        self.assertEqual(sort_versions(['10', '2.1', '3', '1']),
+                         ['1', '2.1', '3', '10'])
+        self.assertEqual(max_version(['9', '10.1', '10']), '10.1')
+        self.assertIsNone(max_version([]))
@@ -15,12 +15,16 @@
 # Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
 
 import os
+import gettext
 import unittest
 import shutil
 import subprocess
 import tempfile
 import tarfile
 import zipfile
+from distutils.spawn import find_executable
+
+from sugar3.activity import bundlebuilder
 
 tests_dir = os.path.dirname(__file__)
 data_dir = os.path.join(tests_dir, "data")
@@ -153,6 +157,10 @@ class TestGit(unittest.TestCase):
         subprocess.call([setup_path, "genpot"])
 
         self.assertTrue(os.path.exists(pot_path))
+        with open(pot_path) as f:
+            pot = f.read()
+        self.assertIn('msgid "Sample"', pot)
+        self.assertIn('msgid "Text string"', pot)
 
         os.chdir(cwd)
 
@@ -243,3 +251,231 @@ class TestGit(unittest.TestCase):
         repo_path = self._create_repo()
         build_path = tempfile.mkdtemp()
         self._test_genpot(repo_path, build_path)
+
+    def test_dist_xo_nested_ignored_dir(self):
+        repo_path = self._create_repo()
+
+        cwd = os.getcwd()
+        os.chdir(repo_path)
+
+        os.makedirs(os.path.join("lib", "dist"))
+        with open(os.path.join("lib", "dist", "lib.js"), "w") as f:
+            f.write("\n")
+        subprocess.check_call(["git", "add", "lib/dist/lib.js"])
+        subprocess.check_call(["git", "commit", "-m", "Add lib", "-a"])
+
+        subprocess.call([os.path.join(repo_path, "setup.py"), "dist_xo"])
+
+        xo_path = os.path.join(repo_path, "dist", "Sample-1.xo")
+        filenames = zipfile.ZipFile(xo_path).namelist()
+        self.assertIn("lib/dist/lib.js", self._strip_root_dir(filenames))
+
+        os.chdir(cwd)
+
+    def test_build_cache_pruned(self):
+        repo_path = self._create_repo()
+        cache_path = os.path.join(repo_path, "dist", ".cache", "locale")
+
+        cwd = os.getcwd()
+        os.chdir(repo_path)
+
+        setup_path = os.path.join(repo_path, "setup.py")
+        subprocess.call([setup_path, "build"])
+        entries = os.listdir(cache_path)
+        self.assertEqual(len(entries), 1)
+
+        po_path = os.path.join(repo_path, "po", "es.po")
+        with open(po_path, "a") as f:
+            f.write("\n# Changed\n")
+        mtime = os.stat(po_path).st_mtime + 10
+        os.utime(po_path, (mtime, mtime))
+
+        subprocess.call([setup_path, "build"])
+        new_entries = os.listdir(cache_path)
+        self.assertEqual(len(new_entries), 1)
+        self.assertNotEqual(new_entries, entries)
+        self.assertFalse(os.path.exists(os.path.join(repo_path, ".cache")))
+
+        os.chdir(cwd)
+
+
+class TestCompilePo(unittest.TestCase):
+    _po = '''msgid ""
+msgstr ""
+"Content-Type: text/plain; charset=UTF-8\\n"
+"Plural-Forms: nplurals=2; plural=(n != 1);\\n"
+
+msgid "Sample"
+msgstr "Ejemplo"
+
+#, fuzzy
+msgid "Fuzzy"
+msgstr "Borroso"
+
+msgid "Untranslated"
+msgstr ""
+
+msgctxt "menu"
+msgid "Open"
+msgstr "Abrir"
+
+msgid "One \\"file\\""
+msgid_plural "%d files"
+msgstr[0] "Un \\"archivo\\""
+msgstr[1] "%d "
+"archivos"
+'''
+
+    def test_compile_po(self):
+        temp_dir = tempfile.mkdtemp()
+        po_path = os.path.join(temp_dir, 'es.po')
+        mo_path = os.path.join(temp_dir, 'es.mo')
+        with open(po_path, 'w') as f:
+            f.write(self._po)
+
+        translations, error = bundlebuilder._compile_po(
+            (po_path, mo_path, ['Sample', 'Untranslated']))
+        self.assertIsNone(error)
+        self.assertEqual(translations, ['Ejemplo', 'Untranslated'])
+
+        with open(mo_path, 'rb') as f:
+            catalog = gettext.GNUTranslations(f)
+        self.assertEqual(catalog.gettext('Sample'), 'Ejemplo')
+        self.assertEqual(catalog.gettext('Fuzzy'), 'Fuzzy')
+        self.assertEqual(catalog.gettext('menu\x04Open'), 'Abrir')
+        self.assertEqual(catalog.ngettext('One "file"', '%d files', 1),
+                         'Un "archivo"')
+        self.assertEqual(catalog.ngettext('One "file"', '%d files', 2),
+                         '%d archivos')
+
+        shutil.rmtree(temp_dir)
+
+    def _compile_po_data(self, po_path, mo_path):
+        with open(po_path, 'w') as f:
+            f.write(self._po)
+        bundlebuilder._compile_po((po_path, mo_path, []))
+        with open(mo_path, 'rb') as f:
+            return f.read()
+
+    def test_compile_po_mo_file(self):
+        temp_dir = tempfile.mkdtemp()
+        data = self._compile_po_data(os.path.join(temp_dir, 'es.po'),
+                                     os.path.join(temp_dir, 'es.mo'))
+
+        # The msgfmt output for _po
+        with open(os.path.join(data_dir, 'compile_po.mo'), 'rb') as f:
+            self.assertEqual(data, f.read())
+
+        shutil.rmtree(temp_dir)
+
+    @unittest.skipIf(find_executable('msgfmt') is None,
+                     'msgfmt is not installed')
+    def test_compile_po_like_msgfmt(self):
+        temp_dir = tempfile.mkdtemp()
+        po_path = os.path.join(temp_dir, 'es.po')
+        msgfmt_mo_path = os.path.join(temp_dir, 'msgfmt.mo')
+        data = self._compile_po_data(po_path,
+                                     os.path.join(temp_dir, 'es.mo'))
+
+        subprocess.check_call(['msgfmt', '-o', msgfmt_mo_path, po_path])
+        with open(msgfmt_mo_path, 'rb') as f:
+            self.assertEqual(data, f.read())
+
+        shutil.rmtree(temp_dir)
+
+
+class TestExtractMessages(unittest.TestCase):
+    _source = '''from gettext import gettext as _
+from gettext import ngettext
+
+
+def f(n):
+    # TRANS: the number of files
+    files = ngettext('%d file', '%d files', n) % n
+    return _('Files') + files, _(variable)
+'''
+
+    def test_extract_messages(self):
+        temp_dir = tempfile.mkdtemp()
+        path = os.path.join(temp_dir, 'sample.py')
+        with open(path, 'w') as f:
+            f.write(self._source)
+
+        messages = bundlebuilder._extract_messages(path)
+        self.assertEqual(messages, [
+            [7, '%d file', '%d files', ['TRANS: the number of files'], True],
+            [8, 'Files', None, [], False]])
+
+        shutil.rmtree(temp_dir)
+
+
+class TestWriteCompressedMember(unittest.TestCase):
+    _source_files = ["activity.py",
+                     "setup.py",
+                     "po/es.po",
+                     "activity/activity.info",
+                     "activity/activity-sample.svg"]
+
+    def _write_zip(self, path, members, compressed):
+        bundle_zip = zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED)
+        for source, arcname in members:
+            if compressed:
+                bundlebuilder._write_compressed_member(
+                    bundle_zip, source, arcname,
+                    *bundlebuilder._compress_member(source))
+            else:
+                bundle_zip.write(source, arcname,
+                                 bundlebuilder._get_compress_type(source))
+        bundle_zip.close()
+
+    def _get_metadata(self, path):
+        bundle_zip = zipfile.ZipFile(path)
+        self.assertIsNone(bundle_zip.testzip())
+        return [(info.filename, info.date_time, info.compress_type,
+                 info.external_attr, info.flag_bits, info.create_system,
+                 info.extract_version, info.CRC, info.file_size,
+                 info.compress_size, info.header_offset)
+                for info in bundle_zip.infolist()]
+
+    def test_same_as_write(self):
+        temp_dir = tempfile.mkdtemp()
+        png_path = os.path.join(temp_dir, 'image.png')
+        with open(png_path, 'wb') as png_file:
+            png_file.write('\x89PNG' + 'x' * 1000)
+
+        members = [(os.path.join(data_dir, 'sample.activity', f),
+                    os.path.join('Sample.activity', f))
+                   for f in self._source_files]
+        members.append((png_path, 'Sample.activity/image.png'))
+
+        write_path = os.path.join(temp_dir, 'write.xo')
+        compressed_path = os.path.join(temp_dir, 'compressed.xo')
+        self._write_zip(write_path, members, False)
+        self._write_zip(compressed_path, members, True)
+
+        self.assertEqual(self._get_metadata(compressed_path),
+                         self._get_metadata(write_path))
+        with open(write_path, 'rb') as f:
+            write_data = f.read()
+        with open(compressed_path, 'rb') as f:
+            self.assertEqual(f.read(), write_data)
+
+        shutil.rmtree(temp_dir)
+
+    def test_incompressible(self):
+        temp_dir = tempfile.mkdtemp()
+        source = os.path.join(temp_dir, 'random.bin')
+        with open(source, 'wb') as f:
+            f.write(os.urandom(4096))
+
+        path = os.path.join(temp_dir, 'random.xo')
+        self._write_zip(path, [(source, 'random.bin')], True)
+
+        bundle_zip = zipfile.ZipFile(path)
+        self.assertIsNone(bundle_zip.testzip())
+        info = bundle_zip.getinfo('random.bin')
+        self.assertEqual(info.compress_type, zipfile.ZIP_STORED)
+        with open(source, 'rb') as f:
+            self.assertEqual(bundle_zip.read('random.bin'), f.read())
+
+        shutil.rmtree(temp_dir)
@@ -0,0 +1,66 @@
+# Copyright (C) 2016, Sugar Labs
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
+
+import unittest
+
+from sugar3 import dispatch
+
+
+class Receiver(object):
+    def __init__(self, name, calls):
+        self._name = name
+        self._calls = calls
+
+    def __call__(self, signal, sender, **kwargs):
+        self._calls.append(self._name)
+        return self._name
+
+
+class TestSignal(unittest.TestCase):
+    def test_send(self):
+        calls = []
+        signal = dispatch.Signal()
+        sender = object()
+        other_sender = object()
+        first = Receiver('first', calls)
+        second = Receiver('second', calls)
+        third = Receiver('third', calls)
+
+        signal.connect(first)
+        signal.connect(second, sender=sender)
+        signal.connect(second, sender=sender)
+        signal.connect(third, sender=other_sender)
+        signal.connect(third)
+
+        responses = signal.send(sender)
+        self.assertEqual([response for receiver_, response in responses],
+                         ['first', 'second', 'third'])
+
+        signal.disconnect(second, sender=sender)
+        signal.send(sender)
+        self.assertEqual(calls, ['first', 'second', 'third',
+                                 'first', 'third'])
+
+    def test_dead_receivers(self):
+        calls = []
+        signal = dispatch.Signal()
+        receiver = Receiver('receiver', calls)
+        signal.connect(receiver)
+        signal.connect(Receiver('dead', calls))
+
+        signal.send(None)
+        self.assertEqual(calls, ['receiver'])
+        self.assertEqual(len(signal.receivers), 1)